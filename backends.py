@@ -0,0 +1,143 @@
+import itertools
+import time
+
+import httpx
+
+# Failures that mean the request never reached the backend, so it is safe
+# to send it to another one
+FAILOVER_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+
+class Backend:
+    """One Ollama instance and its observed load and speed."""
+
+    def __init__(self, url: str, client: httpx.AsyncClient):
+        self.url = url
+        self.client = client
+        self.in_flight = 0
+        self.tokens_per_sec = None  # EWMA of eval_count / eval_duration
+        self.requests = 0
+        self.failures = 0
+        self.down_until = 0.0
+        self.last_error = None
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+    def stats(self) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "tokens_per_sec": self.tokens_per_sec,
+            "requests": self.requests,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+class BackendPool:
+    """Route generations across several Ollama backends.
+
+    Each request goes to the healthy backend with the least expected wait,
+    (in_flight + 1) / tokens_per_sec, with unmeasured backends assumed as
+    fast as the average. Health is checked passively: a connection failure
+    takes a backend out of rotation for `cooldown` seconds, and the caller
+    fails over to the next one.
+    """
+
+    def __init__(
+        self,
+        urls: list,
+        timeout: httpx.Timeout,
+        max_connections: int = 20,
+        cooldown: float = 10.0,
+        smoothing: float = 0.3,
+    ):
+        if not urls:
+            raise ValueError("BackendPool needs at least one backend URL")
+        self.cooldown = cooldown
+        self.smoothing = smoothing
+        self.backends = [
+            Backend(
+                url,
+                httpx.AsyncClient(
+                    base_url=url,
+                    timeout=timeout,
+                    limits=httpx.Limits(
+                        max_connections=max_connections,
+                        max_keepalive_connections=max_connections,
+                    ),
+                ),
+            )
+            for url in urls
+        ]
+        self._round_robin = itertools.count()
+
+    def candidates(self) -> list:
+        """Backends in the order they should be tried for the next request."""
+        speeds = [b.tokens_per_sec for b in self.backends if b.tokens_per_sec]
+        default_speed = sum(speeds) / len(speeds) if speeds else 1.0
+        healthy = [b for b in self.backends if b.healthy]
+        if healthy:
+            # Rotate first so ties spread across backends instead of piling on one
+            offset = next(self._round_robin) % len(healthy)
+            healthy = healthy[offset:] + healthy[:offset]
+            healthy.sort(key=lambda b: (b.in_flight + 1) / (b.tokens_per_sec or default_speed))
+        # Backends in cooldown are a last resort, soonest to recover first
+        down = sorted((b for b in self.backends if not b.healthy), key=lambda b: b.down_until)
+        return healthy + down
+
+    def start(self, backend: Backend):
+        backend.in_flight += 1
+        backend.requests += 1
+
+    def finish(self, backend: Backend, result: dict = None):
+        """Release a backend; `result` is Ollama's final message, if any."""
+        backend.in_flight -= 1
+        if not result:
+            return
+        eval_count = result.get("eval_count")
+        eval_duration = result.get("eval_duration")  # nanoseconds
+        if eval_count and eval_duration:
+            speed = eval_count / (eval_duration / 1e9)
+            if backend.tokens_per_sec is None:
+                backend.tokens_per_sec = speed
+            else:
+                backend.tokens_per_sec += self.smoothing * (speed - backend.tokens_per_sec)
+
+    def mark_down(self, backend: Backend, error: Exception):
+        backend.failures += 1
+        backend.last_error = str(error) or type(error).__name__
+        backend.down_until = time.monotonic() + self.cooldown
+        print(f"Ollama backend {backend.url} unavailable, cooling down {self.cooldown}s: {backend.last_error}")
+
+    async def send(self, method: str, path: str, json: dict, stream: bool = False):
+        """Send a request to the best backend, failing over on connection errors.
+
+        Returns (backend, response) with the backend already counted as
+        in flight; the caller must call finish(backend, ...) when done.
+        Raises the last connection error if every backend fails.
+        """
+        error = None
+        for backend in self.candidates():
+            self.start(backend)
+            request = backend.client.build_request(method, path, json=json)
+            try:
+                return backend, await backend.client.send(request, stream=stream)
+            except FAILOVER_ERRORS as e:
+                self.finish(backend)
+                self.mark_down(backend, e)
+                error = e
+            except BaseException:
+                self.finish(backend)
+                raise
+        raise error
+
+    async def aclose(self):
+        for backend in self.backends:
+            await backend.client.aclose()
+
+    def stats(self) -> list:
+        return [backend.stats() for backend in self.backends]
@@ -0,0 +1,79 @@
+"""Benchmark: spliced Cypher literals vs one parameterized template.
+
+Needs a running FalkorDB (FALKORDB_HOST / FALKORDB_PORT, as for the
+server). A scratch graph is created, queried both ways, then deleted.
+
+The old code put every topic id and user word into the query text, so each
+request had a new string that FalkorDB had to parse and plan. The
+parameterized template is the same text every time, so after the first call
+its plan comes from the cache (reported by QueryResult.cached_execution).
+
+Run from the repo root:
+    python -m benchmarks.bench_cypher_params
+"""
+
+import os
+import random
+import time
+
+import falkordb
+
+from server import TOPICS_BY_ID_QUERY, UPSERT_TOPICS_QUERY
+
+GRAPH = "bench_cypher_params"
+TOPICS = 2_000
+QUERIES = 500
+
+
+def spliced(ids: list) -> str:
+    topic_search = " OR ".join(f"n.id = '{tid}'" for tid in ids)
+    return f"""
+    MATCH (n:Topic)
+    WHERE {topic_search}
+    RETURN n.id AS id, n.category AS category, n.fact AS fact
+    """
+
+
+def run(label: str, fn, id_sets: list):
+    wall = server_ms = cached = 0
+    for ids in id_sets:
+        start = time.perf_counter()
+        result = fn(ids)
+        wall += time.perf_counter() - start
+        server_ms += result.run_time_ms
+        cached += bool(result.cached_execution)
+    n = len(id_sets)
+    print(
+        f"{label:<14} wall {wall / n * 1e3:7.3f} ms  server {server_ms / n:7.3f} ms  "
+        f"plan cache hits {cached}/{n}"
+    )
+
+
+def main():
+    db = falkordb.FalkorDB(
+        host=os.getenv("FALKORDB_HOST", "localhost"),
+        port=int(os.getenv("FALKORDB_PORT", "6381")),
+    )
+    graph = db.select_graph(GRAPH)
+    try:
+        graph.query("CREATE INDEX FOR (n:Topic) ON (n.id)")
+        rows = [
+            {"id": f"topic_{i}", "category": "bench", "fact": f"Fact number {i}."}
+            for i in range(TOPICS)
+        ]
+        graph.query(UPSERT_TOPICS_QUERY, {"rows": rows})
+
+        rng = random.Random(7)
+        id_sets = [
+            [f"topic_{rng.randrange(TOPICS)}" for _ in range(rng.randint(1, 6))]
+            for _ in range(QUERIES)
+        ]
+
+        run("spliced", lambda ids: graph.ro_query(spliced(ids)), id_sets)
+        run("parameterized", lambda ids: graph.ro_query(TOPICS_BY_ID_QUERY, {"ids": ids}), id_sets)
+    finally:
+        graph.delete()
+
+
+if __name__ == "__main__":
+    main()
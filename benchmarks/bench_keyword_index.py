@@ -0,0 +1,82 @@
+"""Benchmark: BM25 inverted index vs a CONTAINS-style substring scan.
+
+The scan reproduces the old fallback query in-process
+(n.id CONTAINS w OR n.fact CONTAINS w for the first five words) over every
+topic. That is a lower bound for what FalkorDB does for an unindexed label
+scan, since it leaves out the network and query parsing.
+
+Run from the repo root:
+    python -m benchmarks.bench_keyword_index
+"""
+
+import itertools
+import random
+import time
+
+from retrieval import InvertedIndex
+
+SIZES = [1_000, 10_000, 100_000]
+QUERIES = 200
+
+
+def synthetic_topics(n: int, rng: random.Random) -> dict:
+    """n topics whose facts draw words from a Zipf-like vocabulary."""
+    vocab = [
+        "".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=rng.randint(3, 10)))
+        for _ in range(20_000)
+    ]
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocab))))
+    topics = {}
+    for i in range(n):
+        words = rng.choices(vocab, cum_weights=cum_weights, k=rng.randint(10, 25))
+        topics[f"topic_{i}_{words[0]}"] = ("synthetic", " ".join(words) + ".")
+    return topics, vocab, cum_weights
+
+
+def contains_scan(topics: dict, query: str, k: int = 3) -> list:
+    words = query.lower().split()[:5]
+    hits = []
+    for tid, (_category, fact) in topics.items():
+        if any(w in tid or w in fact for w in words):
+            hits.append(tid)
+            if len(hits) == k:
+                break
+    return hits
+
+
+def contains_scan_miss(topics: dict, query: str) -> list:
+    """Same scan when nothing matches - it has to visit every node."""
+    return contains_scan(topics, query + " zzzzzz", k=len(topics) + 1)
+
+
+def timed(fn, queries) -> float:
+    start = time.perf_counter()
+    for q in queries:
+        fn(q)
+    return (time.perf_counter() - start) / len(queries) * 1e6
+
+
+def main():
+    rng = random.Random(42)
+    # "scan first-3" stops at the first three hits (the old LIMIT 3, unranked);
+    # "scan no-match" is the same scan when nothing matches and every node is read
+    print(f"{'topics':>8} {'build ms':>9} {'bm25 us':>9} {'scan first-3 us':>16} {'scan no-match us':>17}")
+    for n in SIZES:
+        topics, vocab, cum_weights = synthetic_topics(n, rng)
+        queries = [
+            " ".join(rng.choices(vocab, cum_weights=cum_weights, k=rng.randint(2, 6)))
+            for _ in range(QUERIES)
+        ]
+
+        start = time.perf_counter()
+        index = InvertedIndex(topics)
+        build_ms = (time.perf_counter() - start) * 1e3
+
+        bm25 = timed(lambda q: index.search(q, 3), queries)
+        scan = timed(lambda q: contains_scan(topics, q), queries)
+        full = timed(lambda q: contains_scan_miss(topics, q), queries[:20])
+        print(f"{n:>8} {build_ms:>9.1f} {bm25:>9.1f} {scan:>16.1f} {full:>17.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""Benchmark: end-to-end latency and throughput of server:app under load.
+
+Starts the real server in its own process against a stub Ollama (fixed
+prefill latency and token rate) and an in-memory FalkorDB stand-in loaded
+from KB_PATH, so the numbers cover the server itself - routing, retrieval,
+admission control, streaming - without a GPU or database. Each of
+`--concurrency` clients sends requests back to back for `--duration`
+seconds after a short warm-up.
+
+Reports p50/p95/p99 latency, time to first token (streaming only) and
+requests per second, and writes them as JSON (default
+benchmarks/results/load-<commit>.json). Pass `--baseline` with an earlier
+results file to print the change against it.
+
+Server settings can be overridden with `--env NAME=VALUE`, e.g.
+`--env OLLAMA_MAX_CONCURRENCY=8`. `--workers` runs the server (and the stub
+Ollama) as that many uvicorn worker processes; `--client-processes` splits
+the clients over several processes so the load generator keeps up.
+
+Run from the repo root:
+    python -m benchmarks.bench_load --concurrency 16 --duration 20
+"""
+
+import argparse
+import asyncio
+import collections
+import datetime
+import json
+import multiprocessing
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+PROMPTS = [
+    "hi",
+    "how are you",
+    "what is python",
+    "how many planets are there",
+    "what is photosynthesis",
+    "tell me about the renaissance",
+    "how do i save money",
+    "what is the speed of light",
+    "explain gravity",
+    "what causes rain",
+    "give me some study tips",
+    "what is the capital of the philippines",
+]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start(factory: str, port: int, env: dict, workers: int) -> subprocess.Popen:
+    """Serve the app built by `factory` with uvicorn in its own process.
+
+    Config is read at import time, and every worker imports the app
+    itself, so settings go in through the environment.
+    """
+    command = [
+        sys.executable, "-m", "uvicorn", factory, "--factory",
+        "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(workers), "--log-level", "warning",
+    ]
+    return subprocess.Popen(command, env={**os.environ, **env})
+
+
+def start_stub_ollama(port: int, args) -> subprocess.Popen:
+    env = {
+        "STUB_OLLAMA_TOKEN_RATE": str(args.token_rate),
+        "STUB_OLLAMA_PREFILL": str(args.prefill),
+        "STUB_OLLAMA_TOKENS": str(args.tokens),
+        "STUB_OLLAMA_PARALLEL": str(args.ollama_parallel),
+    }
+    return start("benchmarks.stubs:stub_ollama_from_env", port, env, args.workers)
+
+
+def start_server(port: int, env: dict, args) -> subprocess.Popen:
+    env = {**env, "STUB_GRAPH_LATENCY": str(args.graph_latency)}
+    return start("benchmarks.stubs:memory_graph_server", port, env, args.workers)
+
+
+def wait_ready(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+async def send(client: httpx.AsyncClient, prompt: str, stream: bool):
+    """One request; returns (status, latency, time to first token)."""
+    start = time.perf_counter()
+    ttft = None
+    if not stream:
+        response = await client.post("/generate", json={"prompt": prompt})
+        status = response.status_code
+        # An empty answer means the stub or the server dropped the text
+        if status == 200 and not response.json().get("response"):
+            status = "empty_response"
+        return status, time.perf_counter() - start, None
+
+    async with client.stream("POST", "/generate/stream", json={"prompt": prompt}) as response:
+        status = response.status_code
+        last = None
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            if ttft is None and status == 200:
+                ttft = time.perf_counter() - start
+            last = line
+    if status == 200 and last and "error" in json.loads(last):
+        status = "stream_error"
+    return status, time.perf_counter() - start, ttft
+
+
+async def client_loop(client, stream: bool, measure_from: float, deadline: float, samples: list, rng):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            status, latency, ttft = await send(client, rng.choice(PROMPTS), stream)
+        except httpx.HTTPError as e:
+            status, latency, ttft = type(e).__name__, time.perf_counter() - started, None
+        if started >= measure_from:
+            samples.append((status, latency, ttft))
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {}
+    ms = sorted(v * 1000 for v in values)
+    cuts = statistics.quantiles(ms, n=100, method="inclusive") if len(ms) > 1 else [ms[0]] * 99
+    return {
+        "p50": round(cuts[49], 2),
+        "p95": round(cuts[94], 2),
+        "p99": round(cuts[98], 2),
+        "mean": round(statistics.fmean(ms), 2),
+        "max": round(ms[-1], 2),
+    }
+
+
+async def collect(base_url: str, concurrency: int, args, seed: int, start_at: float):
+    """Run `concurrency` clients from wall-clock time `start_at`; returns (samples, elapsed)."""
+    samples = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits) as client:
+        await asyncio.sleep(max(0.0, start_at - time.time()))
+        now = time.perf_counter()
+        measure_from = now + args.warmup
+        deadline = measure_from + args.duration
+        rng = random.Random(seed)
+        await asyncio.gather(
+            *(
+                client_loop(client, not args.no_stream, measure_from, deadline, samples, random.Random(rng.random()))
+                for _ in range(concurrency)
+            )
+        )
+        elapsed = time.perf_counter() - measure_from
+    return samples, elapsed
+
+
+def collect_in_process(base_url: str, concurrency: int, args, seed: int, start_at: float):
+    return asyncio.run(collect(base_url, concurrency, args, seed, start_at))
+
+
+def drive(base_url: str, args) -> dict:
+    processes = max(1, min(args.client_processes, args.concurrency))
+    if processes == 1:
+        samples, elapsed = collect_in_process(base_url, args.concurrency, args, args.seed, time.time())
+    else:
+        # Clients split as evenly as possible, all starting together once spawned
+        shares = [args.concurrency // processes + (i < args.concurrency % processes) for i in range(processes)]
+        start_at = time.time() + 2.0
+        with multiprocessing.get_context("spawn").Pool(processes) as pool:
+            parts = pool.starmap(
+                collect_in_process,
+                [(base_url, share, args, args.seed + i, start_at) for i, share in enumerate(shares)],
+            )
+        samples = [sample for part_samples, _elapsed in parts for sample in part_samples]
+        elapsed = max(part_elapsed for _samples, part_elapsed in parts)
+
+    ok = [(latency, ttft) for status, latency, ttft in samples if status == 200]
+    errors = collections.Counter(str(status) for status, _l, _t in samples if status != 200)
+    return {
+        "requests": len(samples),
+        "ok": len(ok),
+        "errors": dict(errors),
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(len(ok) / elapsed, 2),
+        "latency_ms": percentiles([latency for latency, _ttft in ok]),
+        "ttft_ms": percentiles([ttft for _latency, ttft in ok if ttft is not None]),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(baseline: dict, results: dict):
+    def line(label, old, new, higher_is_better=False):
+        if not old or new is None:
+            return
+        change = (new - old) / old * 100
+        better = change > 0 if higher_is_better else change < 0
+        print(f"  {label:<18} {old:10.2f} -> {new:10.2f}  {change:+6.1f}% {'better' if better else 'worse'}")
+
+    print(f"vs baseline {baseline.get('commit')} ({baseline.get('timestamp')}):")
+    line("req/s", baseline.get("throughput_rps"), results["throughput_rps"], higher_is_better=True)
+    for metric in ("latency_ms", "ttft_ms"):
+        for p in ("p50", "p95", "p99"):
+            line(f"{metric} {p}", baseline.get(metric, {}).get(p), results[metric].get(p))
+
+
+def build_parser(description: str = __doc__.splitlines()[0]) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--concurrency", type=int, default=8, help="clients sending back to back")
+    parser.add_argument("--client-processes", type=int, default=1, help="processes the clients are split over")
+    parser.add_argument("--workers", type=int, default=1, help="server (and stub Ollama) worker processes")
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds measured")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds run before measuring")
+    parser.add_argument("--no-stream", action="store_true", help="use /generate instead of /generate/stream")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="stub Ollama tokens per second")
+    parser.add_argument("--prefill", type=float, default=0.05, help="stub Ollama seconds before the first token")
+    parser.add_argument("--tokens", type=int, default=32, help="stub Ollama tokens per answer")
+    parser.add_argument(
+        "--ollama-parallel", type=int, default=4, help="stub Ollama concurrent generations, per worker"
+    )
+    parser.add_argument("--graph-latency", type=float, default=0.0, help="seconds added to each graph query")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE", help="server setting")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="results file (default benchmarks/results/load-<commit>.json)")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    return parser
+
+
+def run(args) -> dict:
+    """Start the stub Ollama and the server, drive them, and shut them down."""
+    ollama_port, server_port = free_port(), free_port()
+    env = dict(item.split("=", 1) for item in args.env)
+    env.setdefault("OLLAMA_BASE_URL", f"http://127.0.0.1:{ollama_port}")
+    env.setdefault("KB_LOAD_ON_STARTUP", "false")
+    env.setdefault("KB_WATCH_INTERVAL", "0")
+
+    processes = [start_stub_ollama(ollama_port, args), start_server(server_port, env, args)]
+    try:
+        base_url = f"http://127.0.0.1:{server_port}"
+        wait_ready(f"http://127.0.0.1:{ollama_port}/docs")
+        wait_ready(base_url + "/")
+        return drive(base_url, args)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(5)
+
+
+def main():
+    args = build_parser().parse_args()
+    results = run(args)
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        **results,
+    }
+    output = args.output or os.path.join("benchmarks", "results", f"load-{commit}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(
+        f"{results['ok']}/{results['requests']} ok in {results['elapsed_s']}s, "
+        f"{results['throughput_rps']} req/s, errors {results['errors'] or 'none'}"
+    )
+    print(f"latency ms: {results['latency_ms']}")
+    if results["ttft_ms"]:
+        print(f"TTFT ms:    {results['ttft_ms']}")
+    print(f"saved {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Benchmark: prefill cost with the system prompt inlined vs sent as `system`.
+
+Needs a running Ollama with MODEL_NAME pulled (OLLAMA_BASE_URL, as for the
+server). Each layout answers the same questions with num_predict=1, so the
+time measured is almost all prompt evaluation. Ollama reports
+prompt_eval_count / prompt_eval_duration for the tokens it actually had to
+prefill, so tokens served from the prompt cache show up as savings.
+
+Run from the repo root:
+    python -m benchmarks.bench_prefix_cache
+"""
+
+import os
+import statistics
+
+import httpx
+
+from server import MODEL_NAME, SYSTEM_PROMPT, build_prompt
+
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+
+QUESTIONS = [
+    ("what is python", ["Python is a high-level, interpreted programming language."]),
+    ("how many planets are there", ["There are 8 planets in our solar system."]),
+    ("hi there", []),
+    ("what is photosynthesis", ["Photosynthesis converts light energy into chemical energy."]),
+    ("tell me about the renaissance", ["The Renaissance was a cultural movement in Europe."]),
+    ("how do i save money", ["Budgeting means planning how to spend and save money."]),
+]
+
+
+def inline_payload(question: str, facts: list) -> dict:
+    """The previous layout: system prompt concatenated into `prompt`."""
+    return {
+        "model": MODEL_NAME,
+        "prompt": f"{SYSTEM_PROMPT}\n\n{build_prompt(question, facts)[0]}",
+        "stream": False,
+        "options": {"num_predict": 1},
+    }
+
+
+def system_payload(question: str, facts: list) -> dict:
+    return {
+        "model": MODEL_NAME,
+        "system": SYSTEM_PROMPT,
+        "prompt": build_prompt(question, facts)[0],
+        "stream": False,
+        "options": {"num_predict": 1},
+    }
+
+
+def measure(client: httpx.Client, make_payload, rounds: int = 3):
+    counts, durations = [], []
+    for _ in range(rounds):
+        for question, facts in QUESTIONS:
+            result = client.post("/api/generate", json=make_payload(question, facts)).json()
+            counts.append(result.get("prompt_eval_count", 0))
+            durations.append(result.get("prompt_eval_duration", 0) / 1e6)
+    return statistics.mean(counts), statistics.mean(durations)
+
+
+def main():
+    with httpx.Client(base_url=OLLAMA_BASE_URL, timeout=300) as client:
+        # Load the model first so neither layout pays the load time
+        client.post("/api/generate", json={"model": MODEL_NAME, "prompt": "", "keep_alive": "10m"})
+        for label, make_payload in (("inline", inline_payload), ("system field", system_payload)):
+            tokens, ms = measure(client, make_payload)
+            print(f"{label:<13} prefilled {tokens:6.1f} tokens  {ms:8.2f} ms per request")
+
+
+if __name__ == "__main__":
+    main()
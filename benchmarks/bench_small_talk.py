@@ -0,0 +1,52 @@
+"""Microbenchmark: compiled small-talk matcher vs the old linear substring scan.
+
+Run from the repo root:
+    python -m benchmarks.bench_small_talk
+"""
+
+import timeit
+
+from retrieval import SMALL_TALK_MATCHER, SMALL_TALK_PATTERNS
+
+PROMPTS = [
+    "hi",
+    "hello there, how are you?",
+    "what is python",
+    "which of these is the capital of france",
+    "explain this to me like i'm five",
+    "how many planets are in the solar system",
+    "can you calculate the average of 3, 5 and 10",
+    "thanks, that was helpful!",
+    "what causes gravity and why is the sky blue",
+    "tell me something interesting about history and the renaissance period",
+]
+
+
+def linear_scan(prompt: str) -> list:
+    """The previous approach: substring test for every pattern key."""
+    query_lower = prompt.lower()
+    return [p for p in SMALL_TALK_PATTERNS if p in query_lower]
+
+
+def main(number: int = 20000):
+    old = timeit.timeit(lambda: [linear_scan(p) for p in PROMPTS], number=number)
+    new = timeit.timeit(
+        lambda: [SMALL_TALK_MATCHER.match(p) for p in PROMPTS], number=number
+    )
+    per_call = 1e6 / (number * len(PROMPTS))
+    print(f"patterns: {len(SMALL_TALK_PATTERNS)}, prompts: {len(PROMPTS)}")
+    print(f"linear scan:      {old * per_call:7.2f} us/prompt")
+    print(f"compiled matcher: {new * per_call:7.2f} us/prompt")
+
+    # Each old hit was a separate Cypher round-trip; the matcher needs at most one
+    old_hits = sum(len(linear_scan(p)) for p in PROMPTS)
+    new_lookups = sum(1 for p in PROMPTS if SMALL_TALK_MATCHER.match(p))
+    print(f"graph lookups (worst case): linear {old_hits}, matcher {new_lookups}")
+    for prompt in PROMPTS:
+        old_set, new_set = set(linear_scan(prompt)), set(SMALL_TALK_MATCHER.match(prompt))
+        if old_set != new_set:
+            print(f"  {prompt!r}: dropped {sorted(old_set - new_set)}")
+
+
+if __name__ == "__main__":
+    main()
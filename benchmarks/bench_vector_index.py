@@ -0,0 +1,80 @@
+"""Benchmark: brute-force vector search and persisted-embedding reload.
+
+Search is one float32 matrix-vector product plus argpartition over random
+unit vectors; the query is embedded separately, so only the index itself is
+timed. Reload compares embedding synthetic topics with the hashing
+vectorizer against mapping the .npy file a previous run saved.
+
+Run from the repo root:
+    python -m benchmarks.bench_vector_index
+"""
+
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from embeddings import HashingEmbedder, VectorIndex
+
+SIZES = [1_000, 10_000, 100_000]
+DIMS = [384, 768]
+QUERIES = 200
+
+
+class FixedEmbedder:
+    """Returns precomputed query vectors, so search timing excludes embedding."""
+
+    name = "fixed"
+
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = vectors
+        self.next = 0
+
+    def embed(self, texts: list) -> np.ndarray:
+        self.next = (self.next + 1) % len(self.vectors)
+        return self.vectors[self.next : self.next + 1]
+
+
+def unit_rows(rng: np.random.Generator, n: int, dim: int) -> np.ndarray:
+    matrix = rng.standard_normal((n, dim), dtype=np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def bench_search():
+    rng = np.random.default_rng(0)
+    for dim in DIMS:
+        queries = unit_rows(rng, QUERIES, dim)
+        for n in SIZES:
+            index = VectorIndex([f"t{i}" for i in range(n)], unit_rows(rng, n, dim), FixedEmbedder(queries))
+            start = time.perf_counter()
+            for _ in range(QUERIES):
+                index.search("", k=5)
+            ms = (time.perf_counter() - start) / QUERIES * 1000
+            print(f"search  dim={dim:<4} topics={n:>7,}  {ms:7.3f} ms/query  ({index.matrix.nbytes / 2**20:6.1f} MiB)")
+
+
+def bench_reload(n: int = 10_000):
+    rng = random.Random(0)
+    words = ["".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=rng.randint(3, 9))) for _ in range(5_000)]
+    topics = {f"topic_{i}": ("", " ".join(rng.choices(words, k=20))) for i in range(n)}
+    embedder = HashingEmbedder()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.embeddings.npy")
+        start = time.perf_counter()
+        VectorIndex.build(topics, embedder, path)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        VectorIndex.build(topics, embedder, path)
+        warm = time.perf_counter() - start
+    print(f"reload  topics={n:,}  embed {cold * 1000:8.1f} ms   mapped from disk {warm * 1000:6.1f} ms")
+
+
+def main():
+    bench_search()
+    bench_reload()
+
+
+if __name__ == "__main__":
+    main()
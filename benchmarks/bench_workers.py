@@ -0,0 +1,80 @@
+"""Benchmark: throughput of the non-LLM path against uvicorn worker count.
+
+Runs benchmarks/bench_load.py once per worker count with generation made
+nearly free (no prefill, one token, no streaming) and the context cache
+off, so every request pays for routing, retrieval, prompt building and the
+HTTP hop to Ollama but not for a model. The stub Ollama runs with the same
+number of workers and the clients are split over several processes, so
+neither caps the server.
+
+Each worker holds its own graph snapshot and indexes, so requests share no
+locks and req/s should grow linearly with workers until cores run out. The
+stub and the clients run on the same machine and need cores too, so read
+the results against the CPU count printed with them. Prints req/s, speedup
+and scaling efficiency (speedup / workers), and writes them as JSON
+(default benchmarks/results/workers-<commit>.json).
+
+Run from the repo root:
+    python -m benchmarks.bench_workers --worker-counts 1,2,4,8
+"""
+
+import datetime
+import json
+import os
+
+from benchmarks.bench_load import build_parser, git_commit, run
+
+
+def main():
+    parser = build_parser(__doc__.splitlines()[0])
+    parser.add_argument("--worker-counts", default="1,2,4", help="comma-separated worker counts to run")
+    parser.set_defaults(
+        concurrency=64,
+        client_processes=4,
+        duration=10.0,
+        no_stream=True,
+        prefill=0.0,
+        tokens=1,
+        token_rate=1e6,
+        ollama_parallel=1000,
+    )
+    args = parser.parse_args()
+    # Retrieval on every request, and no queueing in front of the stub
+    args.env = ["CONTEXT_CACHE_SIZE=0", "OLLAMA_MAX_CONCURRENCY=1000", "OLLAMA_QUEUE_SIZE=10000", *args.env]
+
+    cpus = os.cpu_count() or 1
+    runs = []
+    for workers in [int(n) for n in args.worker_counts.split(",")]:
+        args.workers = workers
+        results = run(args)
+        runs.append({"workers": workers, **results})
+        print(
+            f"workers={workers:<3} {results['throughput_rps']:9.1f} req/s  "
+            f"p50 {results['latency_ms'].get('p50')} ms  errors {results['errors'] or 'none'}"
+        )
+
+    base = runs[0]["throughput_rps"] / runs[0]["workers"]
+    print(f"\n{'workers':>7} {'req/s':>9} {'speedup':>8} {'efficiency':>10}   ({cpus} CPUs)")
+    for entry in runs:
+        speedup = entry["throughput_rps"] / base if base else 0.0
+        entry["speedup"] = round(speedup, 2)
+        entry["efficiency"] = round(speedup / entry["workers"], 2)
+        print(f"{entry['workers']:>7} {entry['throughput_rps']:>9.1f} {speedup:>8.2f} {entry['efficiency']:>10.0%}")
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "cpus": cpus,
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "workers")},
+        "runs": runs,
+    }
+    output = args.output or os.path.join("benchmarks", "results", f"workers-{commit}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"saved {output}")
+
+
+if __name__ == "__main__":
+    main()
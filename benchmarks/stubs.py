@@ -0,0 +1,231 @@
+"""Stand-ins for Ollama and FalkorDB, so the server can be benchmarked alone.
+
+stub_ollama_app() serves /api/generate with a fixed prefill latency and
+token rate, and /api/embed from a hashing vectorizer; MemoryGraph answers
+the server's graph queries from dicts. Both return the same shapes as the
+real services, so server.py runs unchanged.
+
+stub_ollama_from_env() and memory_graph_server() build the same apps from
+STUB_* environment variables, for `uvicorn --factory` with several workers.
+"""
+
+import asyncio
+import fnmatch
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+from embeddings import HashingEmbedder
+from retrieval import estimate_tokens
+
+WORDS = ["The", " answer", " is", " a", " short", " and", " friendly", " reply", "."]
+
+
+def stub_ollama_app(
+    token_rate: float = 50.0,
+    prefill: float = 0.05,
+    tokens: int = 64,
+    parallel: int = 4,
+) -> FastAPI:
+    """An Ollama look-alike that spends `prefill` seconds before the first
+    token, then emits `tokens` tokens at `token_rate` per second.
+
+    At most `parallel` generations run at once, like OLLAMA_NUM_PARALLEL;
+    the rest wait, so queueing in front of the model shows up in latency.
+    """
+    app = FastAPI()
+    slots = asyncio.Semaphore(parallel)
+
+    def final_message(prompt_tokens: int, count: int, prefill_s: float, eval_s: float) -> dict:
+        return {
+            "response": "",
+            "done": True,
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(prefill_s * 1e9),
+            "eval_count": count,
+            "eval_duration": int(eval_s * 1e9),
+        }
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        prompt_tokens = estimate_tokens(body.get("system", "") + body.get("prompt", ""))
+        count = min(tokens, body.get("options", {}).get("num_predict") or tokens)
+
+        if not body.get("stream", True):
+            async with slots:
+                await asyncio.sleep(prefill + count / token_rate)
+            text = "".join(WORDS[i % len(WORDS)] for i in range(count))
+            return {**final_message(prompt_tokens, count, prefill, count / token_rate), "response": text}
+
+        async def chunks():
+            async with slots:
+                await asyncio.sleep(prefill)
+                start = time.perf_counter()
+                for i in range(count):
+                    await asyncio.sleep(1 / token_rate)
+                    yield json.dumps({"response": WORDS[i % len(WORDS)], "done": False}) + "\n"
+                eval_s = time.perf_counter() - start
+            yield json.dumps(final_message(prompt_tokens, count, prefill, eval_s)) + "\n"
+
+        return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+    embedder = HashingEmbedder(dim=256)
+
+    @app.post("/api/embed")
+    async def embed(request: Request):
+        body = await request.json()
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        return {"model": body.get("model"), "embeddings": embedder.embed(texts).tolist()}
+
+    return app
+
+
+def stub_ollama_from_env() -> FastAPI:
+    """stub_ollama_app() configured by STUB_OLLAMA_* environment variables."""
+    return stub_ollama_app(
+        token_rate=float(os.getenv("STUB_OLLAMA_TOKEN_RATE", "50")),
+        prefill=float(os.getenv("STUB_OLLAMA_PREFILL", "0.05")),
+        tokens=int(os.getenv("STUB_OLLAMA_TOKENS", "64")),
+        parallel=int(os.getenv("STUB_OLLAMA_PARALLEL", "4")),
+    )
+
+
+def memory_graph_server() -> FastAPI:
+    """server:app reading from a MemoryGraph loaded from KB_PATH.
+
+    STUB_GRAPH_LATENCY sets the seconds added to each graph query.
+    """
+    import server
+    from knowledge_base import read_knowledge_base
+
+    topics, edges = read_knowledge_base(server.KB_PATH)
+    server._graph = server._bulk_graph = MemoryGraph(
+        topics, edges, latency=float(os.getenv("STUB_GRAPH_LATENCY", "0"))
+    )
+    return server.app
+
+
+class QueryResult:
+    def __init__(self, rows: list):
+        self.result_set = rows
+
+
+class MemoryRedis:
+    """The few Redis commands the server uses, on a dict.
+
+    Entries are shared by the threads of one process only, so with several
+    workers each one sees its own store. Expiry (`px`) is ignored.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def get(self, key: str):
+        return self.data.get(key)
+
+    def set(self, key: str, value, px: int = None):
+        self.data[key] = value
+
+    def scan_iter(self, match: str = "*", count: int = None):
+        return [key for key in list(self.data) if fnmatch.fnmatchcase(key, match)]
+
+    def unlink(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def lock(self, name: str, timeout: float = None, blocking_timeout: float = None):
+        with self._guard:
+            return self._locks.setdefault(name, threading.Lock())
+
+
+class MemoryGraph:
+    """In-memory stand-in for the server's FalkorDB graph handle.
+
+    Answers the fixed read templates from server.py out of `topics` and
+    `edges` (as returned by knowledge_base.read_knowledge_base), optionally
+    sleeping `latency` seconds per query to model a network round trip.
+    Writes through the server's sync templates are applied to the same
+    dicts, so syncs and reloads behave as they would on FalkorDB. Like a
+    FalkorDB graph, it has a Redis client at `client.connection`, here a
+    MemoryRedis, for the sync lock and CACHE_BACKEND=shared.
+    """
+
+    def __init__(self, topics: dict, edges: set, latency: float = 0.0):
+        # Imported here so the server module is only loaded in the server process
+        import server
+
+        self.topics = topics
+        self.edges = edges
+        self.latency = latency
+        self.client = SimpleNamespace(connection=MemoryRedis())
+        self.kb_hash = None
+        self.version = None
+        self._reads = {
+            server.TOPICS_BY_ID_QUERY: self._topics_by_id,
+            server.ALL_TOPICS_QUERY: lambda params: [
+                [tid, category, fact] for tid, (category, fact) in self.topics.items()
+            ],
+            server.ALL_EDGES_QUERY: lambda params: [list(edge) for edge in self.edges],
+            server.KB_VERSION_QUERY: lambda params: [[self.kb_hash]] if self.kb_hash else [],
+            server.GRAPH_VERSION_QUERY: lambda params: [[self.version]] if self.version else [],
+        }
+        self._writes = {
+            server.UPSERT_TOPICS_QUERY: self._upsert_topics,
+            server.DELETE_EDGES_QUERY: self._delete_edges,
+            server.DELETE_TOPICS_QUERY: self._delete_topics,
+            server.MERGE_EDGES_QUERY: self._merge_edges,
+            server.SET_KB_VERSION_QUERY: self._set_kb_version,
+        }
+
+    def _topics_by_id(self, params: dict) -> list:
+        return [[tid, *self.topics[tid]] for tid in params["ids"] if tid in self.topics]
+
+    def _upsert_topics(self, params: dict):
+        for row in params["rows"]:
+            self.topics[row["id"]] = (row["category"], row["fact"])
+
+    def _delete_edges(self, params: dict):
+        for row in params["rows"]:
+            self.edges.discard((row["source"], row["target"], row["relation"]))
+
+    def _delete_topics(self, params: dict):
+        ids = set(params["ids"])
+        for tid in ids:
+            self.topics.pop(tid, None)
+        self.edges = {edge for edge in self.edges if edge[0] not in ids and edge[1] not in ids}
+
+    def _merge_edges(self, params: dict):
+        for row in params["rows"]:
+            if row["source"] in self.topics and row["target"] in self.topics:
+                self.edges.add((row["source"], row["target"], row["relation"]))
+
+    def _set_kb_version(self, params: dict):
+        self.kb_hash = params["hash"]
+        self.version = (self.version or 0) + 1
+
+    def ro_query(self, query: str, params: dict = None, timeout: int = None) -> QueryResult:
+        if self.latency:
+            time.sleep(self.latency)
+        read = self._reads.get(query)
+        if read is None:
+            raise ValueError(f"MemoryGraph does not implement query: {query.strip()}")
+        return QueryResult(read(params or {}))
+
+    def query(self, query: str, params: dict = None, timeout: int = None) -> QueryResult:
+        if query in self._reads:
+            return self.ro_query(query, params)
+        write = self._writes.get(query)
+        if write is not None:
+            write(params or {})
+        return QueryResult([])
+
+    def execute_command(self, *args):
+        return "PONG"
@@ -0,0 +1,292 @@
+from collections import Counter, OrderedDict
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+
+from redis.exceptions import RedisError
+
+
+class LRUCache:
+    """Bounded, thread-safe LRU cache with a per-entry time-to-live.
+
+    Entries older than `ttl` seconds are treated as misses and dropped on
+    access. When the cache is full the least recently used entry is evicted.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every entry, e.g. after the underlying data changed."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+_EDGE_PUNCTUATION = re.compile(r"^[\s\"'`]+|[\s?!.,;:\"'`]+$")
+
+
+def char_ngrams(text: str, n: int = 3) -> Counter:
+    """Character n-gram counts of `text`, padded so short words still count."""
+    padded = f" {text} "
+    return Counter(padded[i : i + n] for i in range(max(len(padded) - n + 1, 1)))
+
+
+class ResponseCache:
+    """LRU/TTL cache of LLM answers that also matches near-duplicate prompts.
+
+    Lookups try the exact normalized prompt first, then the most similar
+    cached prompt by cosine similarity of character n-gram TF-IDF vectors.
+    An inverted index from n-gram to entry keeps the scan limited to entries
+    that share at least one n-gram with the prompt.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 512,
+        ttl: float = 3600.0,
+        threshold: float = 0.9,
+        ngram: int = 3,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self.ngram = ngram
+        self._entries = OrderedDict()  # key -> (value, grams, expires_at)
+        self._postings = {}  # n-gram -> set of keys
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def normalize(prompt: str) -> str:
+        # Only trailing punctuation and quotes go: "5+3" vs "5-3", "5.3" and
+        # "C++" vs "C#" are different questions
+        return " ".join(_EDGE_PUNCTUATION.sub("", prompt.lower()).split())
+
+    def _idf(self, gram: str) -> float:
+        df = len(self._postings.get(gram, ()))
+        return math.log((1 + len(self._entries)) / (1 + df)) + 1.0
+
+    def _remove(self, key):
+        _, grams, _ = self._entries.pop(key)
+        for gram in grams:
+            keys = self._postings.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[gram]
+
+    def get(self, prompt: str):
+        """Return the cached value for `prompt` or a near-duplicate, else None."""
+        key = self.normalize(prompt)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] >= now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+            grams = char_ngrams(key, self.ngram)
+            idf = {gram: self._idf(gram) for gram in grams}
+            query_norm = math.sqrt(sum((tf * idf[g]) ** 2 for g, tf in grams.items()))
+
+            dots = Counter()
+            for gram, tf in grams.items():
+                for other in self._postings.get(gram, ()):
+                    dots[other] += tf * idf[gram] * self._entries[other][1][gram] * idf[gram]
+
+            best_key, best_score = None, 0.0
+            for other, dot in dots.items():
+                _, other_grams, expires_at = self._entries[other]
+                if expires_at < now:
+                    continue
+                other_norm = math.sqrt(
+                    sum((tf * self._idf(g)) ** 2 for g, tf in other_grams.items())
+                )
+                score = dot / (query_norm * other_norm) if other_norm else 0.0
+                if score > best_score:
+                    best_key, best_score = other, score
+
+            if best_key is not None and best_score >= self.threshold:
+                self._entries.move_to_end(best_key)
+                self.hits += 1
+                self.similar_hits += 1
+                return self._entries[best_key][0]
+
+            self.misses += 1
+            return None
+
+    def set(self, prompt: str, value):
+        if self.maxsize <= 0:
+            return
+        key = self.normalize(prompt)
+        grams = char_ngrams(key, self.ngram)
+        now = time.monotonic()
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, grams, now + self.ttl)
+            for gram in grams:
+                self._postings.setdefault(gram, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+            # Expired entries are dropped lazily from the LRU end
+            while self._entries:
+                oldest = next(iter(self._entries))
+                if self._entries[oldest][2] >= now:
+                    break
+                self._remove(oldest)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._postings.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class SharedCache:
+    """A worker's local cache in front of a store shared by all workers.
+
+    For multi-worker deployments: an entry one worker computes is served by
+    the others. Lookups try the local cache (LRUCache or ResponseCache)
+    first, then one GET on the Redis store returned by `get_client`; store
+    hits are copied into the local cache. Values are stored as JSON under
+    `namespace`, expiring after the local cache's ttl. `key` maps a local
+    key to the one stored, e.g. ResponseCache.normalize. If given,
+    `version()` is part of every stored key, so workers only share entries
+    computed from the same version of the data. Store errors count as
+    misses, so an outage only costs the sharing.
+    """
+
+    def __init__(self, local, get_client, namespace: str, key=None, version=None):
+        self.local = local
+        self.namespace = namespace
+        self._get_client = get_client
+        self._key = key or (lambda k: k)
+        self._version = version
+        self.shared_hits = 0
+        self.shared_errors = 0
+
+    def _store_key(self, key) -> str:
+        digest = hashlib.sha1(json.dumps(self._key(key)).encode("utf-8")).hexdigest()
+        if self._version is not None:
+            return f"{self.namespace}:{self._version()}:{digest}"
+        return f"{self.namespace}:{digest}"
+
+    def get(self, key, default=None):
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        try:
+            raw = self._get_client().get(self._store_key(key))
+        except (RedisError, OSError):
+            self.shared_errors += 1
+            return default
+        if raw is None:
+            return default
+        value = json.loads(raw)
+        self.local.set(key, value)
+        self.shared_hits += 1
+        return value
+
+    def set(self, key, value):
+        if self.local.maxsize <= 0:
+            return
+        self.local.set(key, value)
+        try:
+            self._get_client().set(
+                self._store_key(key), json.dumps(value), px=int(self.local.ttl * 1000)
+            )
+        except (RedisError, OSError):
+            self.shared_errors += 1
+
+    def clear(self):
+        """Drop every entry, locally and in the shared store."""
+        self.local.clear()
+        try:
+            client = self._get_client()
+            keys = list(client.scan_iter(match=f"{self.namespace}:*", count=1000))
+            for i in range(0, len(keys), 1000):
+                client.unlink(*keys[i : i + 1000])
+        except (RedisError, OSError):
+            self.shared_errors += 1
+
+    def __len__(self):
+        return len(self.local)
+
+    def stats(self) -> dict:
+        return {
+            **self.local.stats(),
+            "shared": True,
+            "shared_hits": self.shared_hits,
+            "shared_errors": self.shared_errors,
+        }
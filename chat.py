@@ -1,17 +1,41 @@
 import requests
 import json
 import sys
+import uuid
+
+# One conversation per run; the server keeps its history under this id
+SESSION_ID = str(uuid.uuid4())
 
 
 def chat(prompt):
     response = requests.post(
-        "http://localhost:5005/generate", json={"prompt": prompt}, timeout=120
+        "http://localhost:5005/generate/stream",
+        json={"prompt": prompt, "session_id": SESSION_ID},
+        stream=True,
+        timeout=120,
     )
-    data = response.json()
+    response.raise_for_status()
     print(f"\nYou: {prompt}")
-    print(f"Bot: {data['response']}")
-    if data.get("context_used"):
+    print("Bot: ", end="", flush=True)
+    context_used = False
+    cached = False
+    for line in response.iter_lines():
+        if not line:
+            continue
+        data = json.loads(line)
+        if data.get("error"):
+            print(f"\nError: {data['error']}", end="")
+            break
+        if data.get("done"):
+            context_used = data.get("context_used", False)
+            cached = data.get("cached", False)
+            break
+        print(data["response"], end="", flush=True)
+    print()
+    if context_used:
         print(f"(Used knowledge graph context)")
+    if cached:
+        print("(Cached response)")
     print()
 
 
@@ -0,0 +1,159 @@
+import asyncio
+
+
+class _Flight:
+    """One in-flight call and the callers waiting on it."""
+
+    def __init__(self, coro):
+        self.task = asyncio.ensure_future(coro)
+        self.waiters = 0
+        self.settled = False  # everything callers need has been delivered
+        self.cancelled = False  # stopping; new callers must not join it
+
+    def release(self):
+        # Nobody is left to receive the result: stop the work, unless all
+        # that is left of it is cleanup
+        self.waiters -= 1
+        if self.waiters == 0 and not self.settled and not self.task.done():
+            self.cancelled = True
+            self.task.cancel()
+
+
+class _Broadcast(_Flight):
+    """One in-flight async stream, replayed to every subscriber.
+
+    Items are kept for the life of the stream, so a subscriber that attaches
+    late still receives it from the first item. Once `last(item)` is true
+    (or, without `last`, once the source is exhausted) the stream counts as
+    settled: readers may stop there, and the source is left to run its
+    cleanup instead of being cancelled. A stream that ends unsettled was
+    cut short, and its readers get an error instead of a truncated end.
+    """
+
+    def __init__(self, source, last=None):
+        self.items = []
+        self.done = False
+        self.error = None
+        self._last = last
+        self._changed = asyncio.Event()
+        super().__init__(self._pump(source))
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _pump(self, source):
+        try:
+            async for item in source:
+                self.items.append(item)
+                if self._last is not None and self._last(item):
+                    self.settled = True
+                self._notify()
+            if self._last is None:
+                self.settled = True
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+            # Runs the source's own cleanup even if we stopped early
+            await source.aclose()
+
+
+class _Subscription:
+    """One caller's position in a _Broadcast; an async iterator."""
+
+    def __init__(self, broadcast: _Broadcast):
+        self._broadcast = broadcast
+        self._next = 0
+        self._closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        broadcast = self._broadcast
+        while True:
+            changed = broadcast._changed
+            if self._next < len(broadcast.items):
+                self._next += 1
+                return broadcast.items[self._next - 1]
+            if broadcast.done:
+                await self.aclose()
+                if broadcast.error is not None:
+                    raise broadcast.error
+                if not broadcast.settled:
+                    raise RuntimeError("shared stream ended before its last item")
+                raise StopAsyncIteration
+            await changed.wait()
+
+    async def aclose(self):
+        if not self._closed:
+            self._closed = True
+            self._broadcast.release()
+
+
+class SingleFlight:
+    """Runs one call per key at a time and shares it with concurrent callers.
+
+    The first caller for a key starts the work as its own task; callers that
+    arrive while it is in flight attach to it instead of repeating it, and
+    all of them get its result or exception. The task is cancelled once
+    every caller has gone away, e.g. when all their clients disconnected.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def _attach(self, key, start):
+        flight = self._flights.get(key)
+        # A cancelled flight stays listed until its cleanup finishes, but it
+        # will never deliver; start over instead of joining it
+        joined = flight is not None and not flight.cancelled
+        if joined:
+            self.coalesced += 1
+        else:
+            flight = self._flights[key] = start()
+            flight.task.add_done_callback(lambda _task: self._forget(key, flight))
+            self.started += 1
+        flight.waiters += 1
+        return flight, joined
+
+    def _forget(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def run(self, key, fn):
+        """Await fn() once for all concurrent callers with `key`.
+
+        Returns (result, joined), where joined is True if this caller
+        attached to a call another caller started.
+        """
+        flight, joined = self._attach(key, lambda: _Flight(fn()))
+        try:
+            return await asyncio.shield(flight.task), joined
+        finally:
+            flight.release()
+
+    def subscribe(self, key, fn, last=None):
+        """Share the async generator fn() among concurrent callers with `key`.
+
+        Returns (items, joined), where items is an async iterator over every
+        item fn() yields. Call its aclose() if you stop reading early. If
+        `last(item)` marks the final item callers need, the generator is not
+        cancelled once it is out, so it can finish cleaning up.
+        """
+        flight, joined = self._attach(key, lambda: _Broadcast(fn(), last))
+        return _Subscription(flight), joined
+
+    def __len__(self):
+        return len(self._flights)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._flights),
+            "started": self.started,
+            "coalesced": self.coalesced,
+        }
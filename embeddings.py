@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+import zlib
+
+import httpx
+import numpy as np
+
+from retrieval import tokenize
+
+
+def topic_text(topic_id: str, fact: str) -> str:
+    """The text embedded for a topic: its readable id, then its fact."""
+    return f"{topic_id.replace('_', ' ')}: {fact or ''}"
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+class HashingEmbedder:
+    """Local, dependency-free embeddings from hashed words and character n-grams.
+
+    Each word, word bigram and character trigram is hashed (crc32, so the
+    result is stable across processes and can be persisted) to one of `dim`
+    buckets with a random sign. Character trigrams let "planetary" and
+    "planets" share features, which BM25 over whole words can't. There is no
+    model behind it, so true paraphrases ("red planet" for Mars) still need
+    the Ollama embedder.
+    """
+
+    def __init__(self, dim: int = 512, ngram: int = 3):
+        self.dim = dim
+        self.ngram = ngram
+        # The trailing version changes whenever tokenize() does, so vectors
+        # persisted with the old features are re-embedded instead of reused
+        self.name = f"hash:{dim}:{ngram}:2"
+
+    def _features(self, text: str):
+        words = tokenize(text)
+        for word in words:
+            yield word, 1.0
+            padded = f" {word} "
+            for i in range(len(padded) - self.ngram + 1):
+                yield "#" + padded[i : i + self.ngram], 0.5
+        for first, second in zip(words, words[1:]):
+            yield f"{first} {second}", 0.5
+
+    def embed(self, texts: list) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, weight in self._features(text):
+                h = zlib.crc32(feature.encode("utf-8"))
+                matrix[row, h % self.dim] += weight if h & 0x80000000 else -weight
+        return _normalize_rows(matrix)
+
+
+class OllamaEmbedder:
+    """Embeddings from an Ollama embedding model via /api/embed.
+
+    Synchronous on purpose: indexing runs in a worker thread at load time
+    and query embedding runs inside the already-threaded retrieval call.
+    """
+
+    def __init__(self, base_url: str, model: str, timeout: float = 60.0, batch_size: int = 64):
+        self.model = model
+        self.batch_size = batch_size
+        self.name = f"ollama:{model}"
+        self._client = httpx.Client(base_url=base_url, timeout=timeout)
+
+    def embed(self, texts: list) -> np.ndarray:
+        rows = []
+        for i in range(0, len(texts), self.batch_size):
+            response = self._client.post(
+                "/api/embed", json={"model": self.model, "input": texts[i : i + self.batch_size]}
+            )
+            response.raise_for_status()
+            rows.extend(response.json()["embeddings"])
+        if not rows:
+            return np.zeros((0, 0), dtype=np.float32)
+        return _normalize_rows(np.asarray(rows, dtype=np.float32))
+
+
+class VectorIndex:
+    """Unit-length topic embeddings in one float32 matrix, searched by dot product.
+
+    A brute-force matrix-vector product costs about 1 ms per 10k topics at
+    384 dimensions (see benchmarks/bench_vector_index.py), well inside the
+    budget at knowledge-base sizes, so there is no ANN structure. The
+    matrix can be persisted next to the knowledge base as a .npy file
+    (loaded with mmap_mode, so a restart maps it instead of recomputing)
+    plus a JSON sidecar recording the embedder and a digest of each topic's
+    text; only topics whose text changed are re-embedded.
+    """
+
+    def __init__(self, ids: list, matrix: np.ndarray, embedder):
+        self.ids = ids
+        self.matrix = matrix
+        self.embedder = embedder
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, topics: dict, embedder, path: str = None):
+        """Embed every topic, reusing rows persisted at `path` when unchanged."""
+        ids = list(topics)
+        if not ids:
+            return cls([], np.zeros((0, 0), dtype=np.float32), embedder)
+        texts = [topic_text(tid, fact) for tid, (_category, fact) in topics.items()]
+        keys = [
+            (tid, hashlib.sha1(text.encode("utf-8")).hexdigest()[:16])
+            for tid, text in zip(ids, texts)
+        ]
+
+        old = cls._load(path, embedder.name) if path else None
+        cached = {}
+        if old is not None:
+            old_matrix, old_meta = old
+            cached = {key: row for row, key in enumerate(zip(old_meta["ids"], old_meta["digests"]))}
+        missing = [i for i, key in enumerate(keys) if key not in cached]
+
+        if not missing and [cached[key] for key in keys] == list(range(len(old_matrix))):
+            # Nothing changed: serve straight from the memory map
+            return cls(ids, old_matrix, embedder)
+
+        fresh = embedder.embed([texts[i] for i in missing]) if missing else None
+        dim = fresh.shape[1] if missing else old_matrix.shape[1]
+        matrix = np.zeros((len(ids), dim), dtype=np.float32)
+        for i, key in enumerate(keys):
+            if key in cached:
+                matrix[i] = old_matrix[cached[key]]
+        if missing:
+            matrix[missing] = fresh
+        print(f"Embedded {len(missing)} of {len(ids)} topics with {embedder.name}")
+
+        if path:
+            meta = {"embedder": embedder.name, "ids": ids, "digests": [d for _tid, d in keys]}
+            cls._save(path, matrix, meta)
+        return cls(ids, matrix, embedder)
+
+    @staticmethod
+    def _load(path: str, embedder_name: str):
+        try:
+            with open(path + ".json", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("embedder") != embedder_name:
+                return None
+            matrix = np.load(path, mmap_mode="r")
+        except (OSError, ValueError) as e:
+            if not isinstance(e, FileNotFoundError):
+                print(f"Ignoring embeddings at {path}: {e}")
+            return None
+        if matrix.ndim != 2 or len(matrix) != len(meta.get("ids", ())):
+            return None
+        return matrix, meta
+
+    @staticmethod
+    def _save(path: str, matrix: np.ndarray, meta: dict):
+        # The sidecar goes first and comes back last, so a crash in between
+        # leaves a matrix without metadata (recomputed) rather than a mismatch.
+        # Renames mean a running process never maps a half-written file, and
+        # per-process temp names keep workers refreshing at once apart.
+        try:
+            os.remove(path + ".json")
+        except FileNotFoundError:
+            pass
+        tmp = f"{path}.{os.getpid()}.tmp"
+        np.save(tmp + ".npy", matrix)
+        os.replace(tmp + ".npy", path)
+        with open(tmp + ".json", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp + ".json", path + ".json")
+
+    def search(self, query: str, k: int = 3, min_score: float = 0.0) -> list:
+        """Return up to k (topic_id, cosine similarity) pairs, best first."""
+        if not self.ids or k <= 0:
+            return []
+        query_vector = self.embedder.embed([query])[0]
+        scores = self.matrix @ query_vector
+        if len(scores) > k:
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.ids[i], float(scores[i])) for i in top if scores[i] >= min_score]
@@ -0,0 +1,92 @@
+import hashlib
+import json
+
+KB_FORMAT = "chatbot-kb"
+KB_FORMAT_VERSION = 1
+
+
+class KnowledgeBaseError(ValueError):
+    """Raised when a knowledge-base file is malformed or has an unknown version."""
+
+
+def iter_records(path: str):
+    """Stream records from a JSONL knowledge-base file.
+
+    The first line is a header {"format": "chatbot-kb", "version": 1}. Every
+    other line is either a topic
+        {"type": "topic", "id": ..., "category": ..., "fact": ...}
+    or an edge
+        {"type": "edge", "source": ..., "target": ..., "relation": ...}.
+    Blank lines are ignored.
+    """
+    with open(path, encoding="utf-8") as f:
+        header = json.loads(f.readline() or "{}")
+        if header.get("format") != KB_FORMAT:
+            raise KnowledgeBaseError(f"{path}: not a {KB_FORMAT} file")
+        if header.get("version") != KB_FORMAT_VERSION:
+            raise KnowledgeBaseError(
+                f"{path}: unsupported version {header.get('version')!r}"
+            )
+
+        for lineno, line in enumerate(f, start=2):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise KnowledgeBaseError(f"{path}:{lineno}: {e}") from None
+            if record.get("type") not in ("topic", "edge"):
+                raise KnowledgeBaseError(
+                    f"{path}:{lineno}: unknown record type {record.get('type')!r}"
+                )
+            yield record
+
+
+def read_knowledge_base(path: str):
+    """Load a knowledge-base file into (topics, edges).
+
+    topics maps id -> (category, fact); edges is a set of
+    (source, target, relation). Later topic lines override earlier ones.
+    """
+    topics = {}
+    edges = set()
+    for record in iter_records(path):
+        if record["type"] == "topic":
+            topics[record["id"]] = (record.get("category", ""), record.get("fact", ""))
+        else:
+            edges.add((record["source"], record["target"], record["relation"]))
+    return topics, edges
+
+
+def file_hash(path: str) -> str:
+    """SHA-256 of the file contents, used as the graph's version stamp."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def diff_knowledge_base(current_topics, current_edges, topics, edges) -> dict:
+    """Compute the changes that turn the current graph into `topics`/`edges`.
+
+    Edges whose endpoints are not topics are left out, since they could
+    never be created in the graph and would otherwise look new on every sync.
+    """
+    added = [tid for tid in topics if tid not in current_topics]
+    changed = [
+        tid
+        for tid in topics
+        if tid in current_topics and current_topics[tid] != topics[tid]
+    ]
+    removed = [tid for tid in current_topics if tid not in topics]
+
+    valid_edges = {e for e in edges if e[0] in topics and e[1] in topics}
+    return {
+        "added": added,
+        "changed": changed,
+        "removed": removed,
+        "edges_added": sorted(valid_edges - current_edges),
+        "edges_removed": sorted(current_edges - valid_edges),
+        "edges_skipped": len(edges) - len(valid_edges),
+    }
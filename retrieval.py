@@ -0,0 +1,557 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
+import math
+import re
+import threading
+import time
+
+import numpy as np
+
+
+SMALL_TALK_PATTERNS = {
+    "hi": ["greeting", "how_are_you", "hello", "hey"],
+    "hello": ["greeting", "how_are_you", "hi", "hey"],
+    "hey": ["greeting", "how_are_you", "hi", "hello"],
+    "how are you": ["how_are_you", "you_good", "whats_up"],
+    "how's your day": ["how_was_your_day", "hows_life"],
+    "good morning": ["good_morning", "greeting"],
+    "good afternoon": ["good_afternoon", "greeting"],
+    "good evening": ["good_evening", "greeting"],
+    "good night": ["good_night", "bye"],
+    "bye": ["bye", "good_night"],
+    "thanks": ["thanks", "thank_you"],
+    "thank you": ["thanks", "thank_you"],
+    "what's up": ["whats_up", "whats_good", "you_good"],
+    "whats up": ["whats_up", "whats_good", "you_good"],
+    # Problem solving & trivia triggers
+    "what is": ["logical_thinking", "problem_solving_steps"],
+    "what are": ["logical_thinking", "problem_solving_steps"],
+    "how do i": ["problem_solving_steps", "study_tips"],
+    "how to": ["problem_solving_steps", "cooking_tips"],
+    "calculate": ["mathematics", "addition", "multiplication"],
+    "compute": ["mathematics", "addition", "multiplication"],
+    "convert": ["unit_conversion", "temperature_conversion"],
+    "capital of": ["capitals", "philippines"],
+    "how many": ["human_body", "planets_count", "continents"],
+    "formula": ["pythagorean_theorem", "area", "perimeter"],
+    "percentage": ["percentage", "mathematics"],
+    "average": ["average", "mathematics"],
+    "square root": ["square_root", "mathematics"],
+    "prime": ["prime_numbers", "mathematics"],
+    "solve": ["problem_solving_steps", "mathematics"],
+    "explain": ["logical_thinking", "critical_thinking"],
+    "difference between": ["logical_thinking", "critical_thinking"],
+    "why is": ["cause_and_effect", "logical_thinking"],
+    "how does": ["cause_and_effect", "logical_thinking"],
+    "what causes": ["cause_and_effect", "logical_thinking"],
+    "planet": ["planets_count", "solar_system"],
+    "ocean": ["oceans", "earth"],
+    "continent": ["continents", "earth"],
+    "country": ["capitals", "largest_country"],
+    "temperature": ["temperature_conversion", "boiling_point", "freezing_point"],
+    "speed of light": ["speed_of_light", "physics"],
+    "dna": ["dna", "biology"],
+    "gravity": ["gravity", "physics"],
+    "photosynthesis": ["photosynthesis", "biology"],
+    "water": ["water_formula", "chemistry"],
+    "budget": ["budgeting", "money_tips"],
+    "save money": ["budgeting", "money_tips"],
+    "study": ["study_tips", "time_management"],
+    "sleep": ["sleep_tips"],
+    "password": ["password_tips"],
+    "file size": ["file_sizes"],
+    "internet": ["internet_speed"],
+    "first aid": ["first_aid"],
+    "time zone": ["time_zones"],
+}
+
+
+def _trie_regex(words) -> str:
+    """Build a regex that matches any of `words`, factored as a prefix trie.
+
+    Python's re engine has no multi-pattern optimisation, so a flat
+    "a|b|c|..." alternation retries every branch at every position. Sharing
+    prefixes lets it reject most positions after one character, which is
+    what an Aho-Corasick automaton would do.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node) -> str:
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Greedy optional: the longer continuation is tried before stopping here
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+def normalize_prompt(text: str) -> str:
+    """Lowercase and collapse whitespace so trivially different prompts share a key."""
+    return " ".join(text.lower().split())
+
+
+class SmallTalkMatcher:
+    """Find every small-talk pattern in a prompt with one compiled regex.
+
+    Patterns only match on word boundaries, so "hi" no longer fires inside
+    "this" or "which". Single words longer than three letters also accept a
+    plural suffix ("planets", "oceans"), which the old substring scan allowed.
+    """
+
+    def __init__(self, patterns: dict):
+        self.topics = dict(patterns)
+
+        # Surface form -> pattern key, including plural variants
+        self._forms = {}
+        for pattern in patterns:
+            self._forms[pattern] = pattern
+            if pattern.isalpha() and len(pattern) > 3:
+                self._forms.setdefault(pattern + "s", pattern)
+                self._forms.setdefault(pattern + "es", pattern)
+        self._regex = re.compile(r"\b" + _trie_regex(self._forms) + r"\b")
+
+    def match(self, text: str) -> list:
+        """Return matched patterns ranked longest first, then by position."""
+        found = {}
+        for m in self._regex.finditer(text.lower()):
+            found.setdefault(self._forms[m.group()], m.start())
+        return sorted(found, key=lambda p: (-len(p), found[p]))
+
+    def topic_ids(self, text: str) -> list:
+        """Return the union of topic ids for all matches, in rank order."""
+        ids = {}
+        for pattern in self.match(text):
+            for tid in self.topics[pattern]:
+                ids.setdefault(tid, None)
+        return list(ids)
+
+
+SMALL_TALK_MATCHER = SmallTalkMatcher(SMALL_TALK_PATTERNS)
+
+
+STOP_WORDS = frozenset(
+    """
+    a about above after again against all am an and any are as at be because
+    been before being below between both but by can could did do does doing
+    down during each few for from further had has have having he her here hers
+    him his how i if in into is it its itself just me more most my no nor not
+    now of off on once only or other our ours out over own same she should so
+    some such than that the their theirs them then there these they this those
+    through to too under until up very was we were what when where which while
+    who whom why will with would you your yours
+    """.split()
+)
+
+# A word plus an optional clitic ("it's", "don't", "earth’s"); the clitic is
+# stripped so its letter never becomes a term of its own
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:['’][a-z]+)?")
+_IRREGULAR_NEGATIONS = {"can't": "can", "won't": "will", "shan't": "shall"}
+
+
+def _strip_clitic(token: str) -> str:
+    """"it's" -> "it", "don't" -> "do", "can't" -> "can"."""
+    token = token.replace("’", "'")
+    if "'" not in token:
+        return token
+    if token in _IRREGULAR_NEGATIONS:
+        return _IRREGULAR_NEGATIONS[token]
+    if token.endswith("n't"):
+        return token[:-3]
+    return token.split("'", 1)[0]
+
+
+def _stem(token: str) -> str:
+    """Strip common plural endings so "planets" and "planet" share a term."""
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> list:
+    """Lowercase, split into words, drop contractions, stop words and plurals."""
+    words = (_strip_clitic(token) for token in _TOKEN_RE.findall(text.lower()))
+    return [_stem(word) for word in words if word not in STOP_WORDS]
+
+
+class InvertedIndex:
+    """In-process BM25 index over topic ids and facts.
+
+    Built once from the graph's topics; queries touch only the posting lists
+    of their own terms instead of scanning every node. Document length
+    normalisation is fixed at build time, so each posting stores its final
+    BM25 term weight and a query is a few vectorised adds. Topic ids count
+    twice so "photosynthesis" ranks the photosynthesis topic above facts that
+    only mention it.
+    """
+
+    def __init__(self, topics: dict, k1: float = 1.2, b: float = 0.75):
+        self.ids = []
+        term_counts = []
+        for tid, (_category, fact) in topics.items():
+            terms = tokenize(tid.replace("_", " ")) * 2 + tokenize(fact or "")
+            self.ids.append(tid)
+            term_counts.append(Counter(terms))
+
+        lengths = np.array([sum(c.values()) for c in term_counts], dtype=np.float32)
+        avg = float(lengths.mean()) if len(lengths) else 1.0
+        norms = k1 * (1 - b + b * lengths / avg)
+
+        docs = {}
+        tfs = {}
+        for doc, counts in enumerate(term_counts):
+            for term, tf in counts.items():
+                docs.setdefault(term, []).append(doc)
+                tfs.setdefault(term, []).append(tf)
+
+        n = len(self.ids)
+        self._doc = {tid: doc for doc, tid in enumerate(self.ids)}
+        self._postings = {}  # term -> (doc ids, BM25 weights without idf)
+        self._idf = {}
+        for term, doc_list in docs.items():
+            doc_array = np.array(doc_list, dtype=np.int32)
+            tf = np.array(tfs[term], dtype=np.float32)
+            self._postings[term] = (doc_array, tf * (k1 + 1) / (tf + norms[doc_array]))
+            df = len(doc_list)
+            self._idf[term] = math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def idf(self, term: str) -> float:
+        return self._idf.get(term, 0.0)
+
+    def _totals(self, query: str):
+        """Dense BM25 score per document for `query`, or None if no term is known."""
+        terms = [t for t in Counter(tokenize(query)).items() if t[0] in self._postings]
+        if not terms:
+            return None
+        # Each term's doc ids are unique, so plain fancy-index adds are safe
+        totals = np.zeros(len(self.ids), dtype=np.float32)
+        for term, qtf in terms:
+            doc_array, weights = self._postings[term]
+            totals[doc_array] += weights * (self._idf[term] * qtf)
+        return totals
+
+    def search(self, query: str, k: int = 3) -> list:
+        """Return up to k (topic_id, score) pairs, best first."""
+        totals = self._totals(query)
+        if totals is None or k <= 0:
+            return []
+        candidates = np.flatnonzero(totals)
+        scores = totals[candidates]
+        if len(scores) > k:
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.ids[candidates[i]], float(scores[i])) for i in top]
+
+    def score(self, query: str, topic_ids) -> dict:
+        """BM25 score of `query` against each of topic_ids (0.0 if unknown)."""
+        totals = self._totals(query)
+        if totals is None:
+            return {tid: 0.0 for tid in topic_ids}
+        return {
+            tid: float(totals[self._doc[tid]]) if tid in self._doc else 0.0
+            for tid in topic_ids
+        }
+
+
+def relative_cutoff(ranked: list, ratio: float) -> list:
+    """Drop (topic_id, score) pairs scoring below `ratio` times the best."""
+    if not ranked:
+        return []
+    cutoff = ranked[0][1] * ratio
+    return [(tid, score) for tid, score in ranked if score > 0 and score >= cutoff]
+
+
+def reciprocal_rank_fusion(rankings: dict, weights: dict = None, k: int = 60) -> list:
+    """Merge best-first (topic_id, score) lists from several retrievers.
+
+    A topic scores weight / (k + rank) for each list it appears in, summed,
+    so retrievers that agree reinforce each other. Each term is also scaled
+    by the topic's score relative to the top of its own list: raw scores
+    (BM25, cosine similarity) still never share a scale, but a distant
+    second place counts for less than a close one, so the relative cutoff
+    can drop it. Returns (topic_id, fused score) pairs, best first.
+    """
+    weights = weights or {}
+    fused = {}
+    for name, ranked in rankings.items():
+        if not ranked:
+            continue
+        weight = weights.get(name, 1.0)
+        top = ranked[0][1] or 1.0
+        for rank, (tid, score) in enumerate(ranked, start=1):
+            fused[tid] = fused.get(tid, 0.0) + weight * (score / top) / (k + rank)
+    return sorted(fused.items(), key=lambda item: -item[1])
+
+
+# Fusion weight per retriever. Small-talk patterns count for a quarter of a
+# keyword or vector hit, so with the relative cutoff a generic trigger like
+# "what is" is dropped whenever something specific matched, while greetings
+# with no keywords still get their topics.
+RETRIEVER_WEIGHTS = {"pattern": 0.25, "lexical": 1.0, "vector": 1.0}
+
+
+class RetrievalPipeline:
+    """Run several retrievers for one query and fuse their rankings.
+
+    A retriever is a callable (query, k) -> [(topic_id, score)], best first.
+    Background retrievers (anything that leaves the process, like an
+    embedding call to Ollama) start first on a thread pool; inline ones
+    (in-memory pattern and keyword search) then run in the calling thread
+    while those are in flight. Whatever has finished `budget` seconds after
+    the start is fused with reciprocal-rank fusion; a retriever still
+    running is left behind and its result dropped, so one slow source can't
+    stall the request. A background retriever with `max_pending` calls
+    already outstanding is skipped rather than queued.
+    """
+
+    def __init__(
+        self,
+        budget: float = 0.1,
+        weights: dict = None,
+        rrf_k: int = 60,
+        min_score_ratio: float = 0.3,
+        max_pending: int = 8,
+    ):
+        self.budget = budget
+        self.weights = dict(RETRIEVER_WEIGHTS if weights is None else weights)
+        self.rrf_k = rrf_k
+        self.min_score_ratio = min_score_ratio
+        self.max_pending = max_pending
+        self._retrievers = {}  # name -> (fn, background)
+        self._stats = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def add(self, name: str, fn, background: bool = False):
+        self._retrievers[name] = (fn, background)
+        self._stats[name] = {"calls": 0, "timeouts": 0, "errors": 0, "skipped": 0, "total_ms": 0.0}
+        self._pending[name] = 0
+        if background and self._executor is None:
+            self._executor = ThreadPoolExecutor(thread_name_prefix="retriever")
+
+    def _call(self, name: str, fn, query: str, k: int) -> list:
+        start = time.perf_counter()
+        try:
+            return fn(query, k)
+        finally:
+            with self._lock:
+                self._stats[name]["calls"] += 1
+                self._stats[name]["total_ms"] += (time.perf_counter() - start) * 1000
+
+    def _background_done(self, name: str):
+        with self._lock:
+            self._pending[name] -= 1
+
+    def run(self, query: str, k: int = 3) -> list:
+        """Return up to k fused (topic_id, score) pairs for `query`."""
+        start = time.monotonic()
+        futures = {}
+        for name, (fn, background) in self._retrievers.items():
+            if not background:
+                continue
+            with self._lock:
+                if self._pending[name] >= self.max_pending:
+                    self._stats[name]["skipped"] += 1
+                    continue
+                self._pending[name] += 1
+            future = self._executor.submit(self._call, name, fn, query, k)
+            future.add_done_callback(lambda _f, name=name: self._background_done(name))
+            futures[future] = name
+
+        rankings = {}
+        for name, (fn, background) in self._retrievers.items():
+            if background:
+                continue
+            try:
+                rankings[name] = self._call(name, fn, query, k)
+            except Exception as e:
+                self._failed(name, e)
+
+        if futures:
+            done, late = wait(futures, timeout=max(self.budget - (time.monotonic() - start), 0))
+            for future in done:
+                try:
+                    rankings[futures[future]] = future.result()
+                except Exception as e:
+                    self._failed(futures[future], e)
+            with self._lock:
+                for future in late:
+                    self._stats[futures[future]]["timeouts"] += 1
+
+        fused = reciprocal_rank_fusion(rankings, self.weights, self.rrf_k)[:k]
+        return relative_cutoff(fused, self.min_score_ratio)
+
+    def _failed(self, name: str, error: Exception):
+        print(f"Retriever {name} failed: {error}")
+        with self._lock:
+            self._stats[name]["errors"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                name: {
+                    "calls": s["calls"],
+                    "timeouts": s["timeouts"],
+                    "errors": s["errors"],
+                    "skipped": s["skipped"],
+                    "avg_ms": round(s["total_ms"] / s["calls"], 3) if s["calls"] else 0.0,
+                }
+                for name, s in self._stats.items()
+            }
+
+
+# What a Llama-style SentencePiece vocabulary splits text into: runs of
+# letters, single digits, and single punctuation marks or newlines
+_PIECE_RE = re.compile(r"[^\W\d_]+|[\d_]|[^\w \t\r\f\v]")
+
+
+def _piece_tokens(piece: str) -> int:
+    if not piece.isascii():
+        return len(piece)  # non-Latin scripts run about a token per character
+    # Common words are one token, longer ones split into ~6-character subwords
+    return 1 + (len(piece) - 1) // 6
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count for a Llama-style tokenizer, without loading one.
+
+    Counts words, digits, punctuation and newlines separately, since those
+    are what the model's tokenizer splits on. Estimates are additive, so
+    sections joined by newlines cost the sum of their parts plus one per
+    newline.
+    """
+    return sum(_piece_tokens(piece) for piece in _PIECE_RE.findall(text))
+
+
+def truncate_tokens(text: str, max_tokens: int, from_end: bool = False) -> str:
+    """Cut text to about max_tokens on a piece boundary, marking the cut with "...".
+
+    Keeps the start of the text, or its end if `from_end` is set. The
+    marker's three tokens count against max_tokens.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    pieces = list(_PIECE_RE.finditer(text))
+    if from_end:
+        pieces.reverse()
+    used = 0
+    for match in pieces:
+        used += _piece_tokens(match.group())
+        if used > max_tokens - 3:
+            if from_end:
+                return "..." + text[match.end():].lstrip()
+            return text[: match.start()].rstrip() + "..."
+    return text
+
+
+# How much a neighbor reached over each relation is worth, relative to the
+# topic it was reached from. Definitional links are kept, loose ones fade.
+RELATION_WEIGHTS = {
+    "is_a": 0.8,
+    "is_subset_of": 0.8,
+    "is_part_of": 0.7,
+    "part_of": 0.7,
+    "based_on": 0.7,
+    "includes": 0.6,
+    "contains": 0.6,
+    "uses": 0.6,
+    "used_in": 0.6,
+    "requires": 0.6,
+    "enables": 0.5,
+    "related_to": 0.5,
+}
+DEFAULT_RELATION_WEIGHT = 0.4
+
+
+class Neighborhood:
+    """In-memory adjacency of RELATED edges for context expansion.
+
+    Built alongside the keyword index from the same graph read, so
+    expanding the retrieved topics to their neighbors needs no extra
+    round-trips. Edges are followed in both directions. The adjacency is
+    stored in CSR form: topic i's neighbors are indices[indptr[i]:indptr[i + 1]]
+    with matching relation weights, three flat arrays instead of a list per
+    topic. `index` (topic id -> row) can be shared with the caller.
+    """
+
+    def __init__(self, topics: dict, edges, index: dict = None):
+        self.index = index if index is not None else {tid: i for i, tid in enumerate(topics)}
+        self.ids = list(self.index)
+        sources, targets, weights = [], [], []
+        for source, target, relation in edges:
+            if source not in self.index or target not in self.index:
+                continue
+            weight = RELATION_WEIGHTS.get(relation, DEFAULT_RELATION_WEIGHT)
+            a, b = self.index[source], self.index[target]
+            sources += (a, b)
+            targets += (b, a)
+            weights += (weight, weight)
+
+        n = len(self.ids)
+        sources = np.asarray(sources, dtype=np.int32)
+        order = np.argsort(sources, kind="stable")
+        self.indptr = np.zeros(n + 1, dtype=np.int32)
+        np.cumsum(np.bincount(sources, minlength=n), out=self.indptr[1:])
+        self.indices = np.asarray(targets, dtype=np.int32)[order]
+        self.weights = np.asarray(weights, dtype=np.float64)[order]
+        self._tokens = np.array(
+            [estimate_tokens(topics[tid][1] or "") for tid in self.ids], dtype=np.int32
+        )
+
+    def __len__(self):
+        """Number of directed adjacency entries (two per edge)."""
+        return len(self.indices)
+
+    def neighbors(self, row: int):
+        """(neighbor row, weight) pairs for topic `row`."""
+        start, end = self.indptr[row], self.indptr[row + 1]
+        return zip(self.indices[start:end].tolist(), self.weights[start:end].tolist())
+
+    def expand(self, seeds: list, hops: int = 1, token_budget: int = 96, decay: float = 0.5) -> list:
+        """Return neighbor (topic_id, score) pairs for the ranked seed topics.
+
+        Scores are the seed score times the relation weight, times `decay`
+        for each hop past the first. Neighbors are taken best first until
+        their facts would exceed `token_budget`.
+        """
+        frontier = [(self.index[tid], score) for tid, score in seeds if tid in self.index]
+        seen = {row for row, _score in frontier}
+        best = {}
+        for hop in range(hops):
+            factor = decay ** hop
+            next_frontier = {}
+            for row, score in frontier:
+                for neighbor, weight in self.neighbors(row):
+                    if neighbor in seen:
+                        continue
+                    value = score * weight * factor
+                    if value > next_frontier.get(neighbor, 0.0):
+                        next_frontier[neighbor] = value
+            for neighbor, value in next_frontier.items():
+                best[neighbor] = max(best.get(neighbor, 0.0), value)
+            seen.update(next_frontier)
+            frontier = list(next_frontier.items())
+
+        expanded = []
+        used = 0
+        for row, score in sorted(best.items(), key=lambda item: -item[1]):
+            cost = int(self._tokens[row])
+            if used + cost > token_budget:
+                continue
+            expanded.append((self.ids[row], score))
+            used += cost
+        return expanded
@@ -0,0 +1,130 @@
+from collections import deque
+from contextlib import asynccontextmanager
+import asyncio
+import time
+
+
+class QueueFullError(Exception):
+    """The admission queue is at capacity; the caller should retry later."""
+
+
+class QueueTimeoutError(Exception):
+    """A request waited longer than the queue timeout for a slot."""
+
+
+class AdmissionScheduler:
+    """Bounded admission queue in front of the LLM backend.
+
+    At most `max_concurrency` generations run at once. Further requests wait
+    in one of two FIFO queues: short prompts are served first so quick
+    questions aren't stuck behind long ones, but a long prompt that has
+    waited `aging` seconds goes next regardless, so nothing starves. When
+    `max_queue` requests are already waiting, new ones are rejected at once
+    with QueueFullError instead of piling up.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        max_queue: int = 64,
+        timeout: float = 60.0,
+        aging: float = 5.0,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.aging = aging
+        self.in_flight = 0
+        self._short = deque()
+        self._long = deque()
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def depth(self) -> int:
+        return len(self._short) + len(self._long)
+
+    def _next_waiter(self):
+        now = time.monotonic()
+        while self._short or self._long:
+            if self._long and (
+                not self._short or now - self._long[0][0] >= self.aging
+            ):
+                _enqueued, future = self._long.popleft()
+            else:
+                _enqueued, future = self._short.popleft()
+            if not future.done():
+                return future
+        return None
+
+    async def acquire(self, short: bool = True) -> float:
+        """Wait for a slot; returns the seconds spent queued."""
+        if self.in_flight < self.max_concurrency and not self.depth:
+            self.in_flight += 1
+            self.admitted += 1
+            return 0.0
+        if self.depth >= self.max_queue:
+            self.rejected += 1
+            raise QueueFullError(f"{self.depth} requests already queued")
+
+        enqueued = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        queue = self._short if short else self._long
+        queue.append((enqueued, future))
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            self._abandon(queue, (enqueued, future))
+            self.timed_out += 1
+            raise QueueTimeoutError(f"no slot within {self.timeout}s")
+        except asyncio.CancelledError:
+            self._abandon(queue, (enqueued, future))
+            raise
+
+        waited = time.monotonic() - enqueued
+        self.admitted += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        return waited
+
+    def _abandon(self, queue, entry):
+        """Take a waiter that gave up out of the queue, so depth stays true."""
+        _enqueued, future = entry
+        if future.done() and not future.cancelled():
+            # Granted just as it gave up - hand the slot back
+            self.release()
+        else:
+            queue.remove(entry)
+        future.cancel()
+
+    def release(self):
+        """Free a slot, handing it straight to the next waiter if any."""
+        future = self._next_waiter()
+        if future is not None:
+            future.set_result(None)  # the slot passes over, in_flight unchanged
+        else:
+            self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self, short: bool = True):
+        waited = await self.acquire(short)
+        try:
+            yield waited
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": self.depth,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_wait": self.total_wait / self.admitted if self.admitted else 0.0,
+            "max_wait": self.max_wait,
+        }
@@ -1,11 +1,125 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-import requests
+from typing import List, Optional
+import asyncio
+import httpx
+import json
 import os
+import threading
+import time
 import falkordb
+import redis
+from redis.backoff import ExponentialBackoff
+from redis.exceptions import ConnectionError as RedisConnectionError
+from redis.exceptions import RedisError
+from redis.exceptions import TimeoutError as RedisTimeoutError
+from redis.retry import Retry
 
-app = FastAPI()
+from backends import FAILOVER_ERRORS, BackendPool
+from cache import LRUCache, ResponseCache, SharedCache
+from coalesce import SingleFlight
+from embeddings import HashingEmbedder, OllamaEmbedder, VectorIndex
+from knowledge_base import diff_knowledge_base, file_hash, read_knowledge_base
+from metrics import Counter, Histogram, Spans, render as render_metrics
+from retrieval import (
+    SMALL_TALK_MATCHER,
+    InvertedIndex,
+    RetrievalPipeline,
+    estimate_tokens,
+    normalize_prompt,
+    relative_cutoff,
+    truncate_tokens,
+)
+from scheduler import AdmissionScheduler, QueueFullError, QueueTimeoutError
+from sessions import SessionStore
+from snapshot import GraphSnapshot
+
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+# Comma-separated list of Ollama replicas; defaults to OLLAMA_BASE_URL alone
+OLLAMA_BASE_URLS = [
+    url.strip()
+    for url in os.getenv("OLLAMA_BASE_URLS", OLLAMA_BASE_URL).split(",")
+    if url.strip()
+]
+# Seconds a backend stays out of rotation after a connection failure
+OLLAMA_BACKEND_COOLDOWN = float(os.getenv("OLLAMA_BACKEND_COOLDOWN", "10"))
+MODEL_NAME = os.getenv("MODEL_NAME", "tinyllama")
+# How long Ollama keeps the model (and its prompt cache) loaded between requests
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "120"))
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "20"))
+# The model's context window and how much of it is kept free for the answer;
+# everything else is the budget for system prompt, history, facts and question
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "2048"))
+GENERATION_RESERVE_TOKENS = int(os.getenv("GENERATION_RESERVE_TOKENS", "512"))
+PROMPT_TOKEN_BUDGET = int(
+    os.getenv("PROMPT_TOKEN_BUDGET", str(OLLAMA_NUM_CTX - GENERATION_RESERVE_TOKENS))
+)
+
+# Admission control in front of Ollama: concurrent generations, waiting
+# requests beyond which new ones get 429, and the longest wait before 503
+OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "4"))
+OLLAMA_QUEUE_SIZE = int(os.getenv("OLLAMA_QUEUE_SIZE", "64"))
+OLLAMA_QUEUE_TIMEOUT = float(os.getenv("OLLAMA_QUEUE_TIMEOUT", "60"))
+# Prompts up to this many tokens jump ahead of longer ones, which are
+# promoted anyway after waiting SCHEDULER_AGING seconds
+SCHEDULER_SHORT_PROMPT_TOKENS = int(os.getenv("SCHEDULER_SHORT_PROMPT_TOKENS", "64"))
+SCHEDULER_AGING = float(os.getenv("SCHEDULER_AGING", "5"))
+# /generate/batch: most prompts per request, and how many of them run at once
+# (they queue as long prompts, so interactive requests still go first)
+BATCH_MAX_PROMPTS = int(os.getenv("BATCH_MAX_PROMPTS", "1000"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", str(OLLAMA_MAX_CONCURRENCY)))
+# Identical requests in flight at the same time (same normalized question and
+# context) share one generation instead of each running their own
+REQUEST_COALESCING = os.getenv("REQUEST_COALESCING", "true").lower() == "true"
+
+# Keep-alive connection pools to each Ollama backend, opened in lifespan()
+ollama_backends = None
+
+scheduler = AdmissionScheduler(
+    max_concurrency=OLLAMA_MAX_CONCURRENCY,
+    max_queue=OLLAMA_QUEUE_SIZE,
+    timeout=OLLAMA_QUEUE_TIMEOUT,
+    aging=SCHEDULER_AGING,
+)
+
+# In-flight generations and context lookups, for REQUEST_COALESCING
+flights = SingleFlight()
+lookup_flights = SingleFlight()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global ollama_backends
+    ollama_backends = BackendPool(
+        OLLAMA_BASE_URLS,
+        timeout=httpx.Timeout(OLLAMA_TIMEOUT, connect=10.0),
+        max_connections=OLLAMA_MAX_CONNECTIONS,
+        cooldown=OLLAMA_BACKEND_COOLDOWN,
+    )
+    if KB_LOAD_ON_STARTUP:
+        await asyncio.to_thread(setup_knowledge_graph)
+    if keyword_index is None:
+        await asyncio.to_thread(refresh_retrieval_index)
+    watchers = []
+    if KB_WATCH_INTERVAL > 0:
+        watchers.append(asyncio.create_task(watch_knowledge_base(KB_WATCH_INTERVAL)))
+    if GRAPH_SNAPSHOT and GRAPH_SNAPSHOT_REFRESH_INTERVAL > 0:
+        watchers.append(asyncio.create_task(watch_graph_version(GRAPH_SNAPSHOT_REFRESH_INTERVAL)))
+    try:
+        yield
+    finally:
+        for watcher in watchers:
+            watcher.cancel()
+        await ollama_backends.aclose()
+        ollama_backends = None
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -15,1102 +129,665 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-MODEL_NAME = os.getenv("MODEL_NAME", "tinyllama")
-
 FALKORDB_HOST = os.getenv("FALKORDB_HOST", "localhost")
 FALKORDB_PORT = int(os.getenv("FALKORDB_PORT", "6381"))
 
 GRAPH_NAME = "chatbot_knowledge"
+KB_PATH = os.getenv(
+    "KB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "knowledge_base.jsonl")
+)
+# Seconds between checks of KB_PATH for changes; 0 disables the watcher
+KB_WATCH_INTERVAL = float(os.getenv("KB_WATCH_INTERVAL", "0"))
+# Drop keyword matches scoring below this fraction of the best BM25 match
+RETRIEVAL_MIN_SCORE_RATIO = float(os.getenv("RETRIEVAL_MIN_SCORE_RATIO", "0.3"))
+# After fusing retrievers, drop topics below this fraction of the best
+RETRIEVAL_FUSED_MIN_RATIO = float(os.getenv("RETRIEVAL_FUSED_MIN_RATIO", "0.5"))
+# Retrievers still running this long after a lookup starts are ignored
+RETRIEVAL_BUDGET_MS = float(os.getenv("RETRIEVAL_BUDGET_MS", "100"))
+# Follow RELATED edges this many hops from the retrieved topics (0 = off),
+# adding neighbor facts until they would exceed the token budget
+CONTEXT_EXPANSION_HOPS = int(os.getenv("CONTEXT_EXPANSION_HOPS", "0"))
+CONTEXT_EXPANSION_TOKENS = int(os.getenv("CONTEXT_EXPANSION_TOKENS", "96"))
+KB_BATCH_SIZE = int(os.getenv("KB_BATCH_SIZE", "500"))
+# Optional embedding retrieval next to keywords: "off", "hash" (local hashing
+# vectorizer, EMBEDDING_DIM wide) or "ollama" (EMBEDDING_MODEL via /api/embed)
+VECTOR_RETRIEVAL = os.getenv("VECTOR_RETRIEVAL", "off").lower()
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "nomic-embed-text")
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "512"))
+# Topic embeddings are kept here between restarts (memory-mapped on load)
+EMBEDDINGS_PATH = os.getenv("EMBEDDINGS_PATH", os.path.splitext(KB_PATH)[0] + ".embeddings.npy")
+# Vector hits below this cosine similarity are ignored
+VECTOR_MIN_SCORE = float(os.getenv("VECTOR_MIN_SCORE", "0.3"))
+# Set to "false" when the graph is loaded separately with `python server.py load-kb`
+KB_LOAD_ON_STARTUP = os.getenv("KB_LOAD_ON_STARTUP", "true").lower() == "true"
+# Serve facts and neighbors from an in-process snapshot of the graph instead
+# of a FalkorDB round trip per request
+GRAPH_SNAPSHOT = os.getenv("GRAPH_SNAPSHOT", "true").lower() == "true"
+# Seconds between checks of the graph's version counter; 0 disables, so the
+# snapshot only follows syncs made by this process
+GRAPH_SNAPSHOT_REFRESH_INTERVAL = float(os.getenv("GRAPH_SNAPSHOT_REFRESH_INTERVAL", "5"))
+
+CONTEXT_CACHE_SIZE = int(os.getenv("CONTEXT_CACHE_SIZE", "1024"))
+CONTEXT_CACHE_TTL = float(os.getenv("CONTEXT_CACHE_TTL", "300"))
+
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "10000"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", "1800"))
+# Recent turns kept verbatim, and the cap on the summary of older ones
+SESSION_HISTORY_TOKENS = int(os.getenv("SESSION_HISTORY_TOKENS", "512"))
+SESSION_SUMMARY_TOKENS = int(os.getenv("SESSION_SUMMARY_TOKENS", "128"))
+
+FALKORDB_POOL_SIZE = int(os.getenv("FALKORDB_POOL_SIZE", "16"))
+# Socket and pool-wait timeout in seconds, and server-side limit for reads
+FALKORDB_TIMEOUT = float(os.getenv("FALKORDB_TIMEOUT", "2"))
+FALKORDB_QUERY_TIMEOUT_MS = int(os.getenv("FALKORDB_QUERY_TIMEOUT_MS", "1000"))
+FALKORDB_RETRIES = int(os.getenv("FALKORDB_RETRIES", "2"))
+# Writes and full-graph reads (syncs, snapshot refreshes) run on their own
+# small pool, with this socket timeout in seconds (0 = none) and no
+# server-side limit, so a large graph isn't cut off by the request timeouts
+FALKORDB_BULK_POOL_SIZE = int(os.getenv("FALKORDB_BULK_POOL_SIZE", "2"))
+FALKORDB_BULK_TIMEOUT = float(os.getenv("FALKORDB_BULK_TIMEOUT", "0"))
+# After a connection failure, fail fast for this many seconds before retrying
+FALKORDB_RECONNECT_BACKOFF = float(os.getenv("FALKORDB_RECONNECT_BACKOFF", "5"))
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.9"))
+
+# "local" keeps the caches in each worker; "shared" also stores them on the
+# FalkorDB instance, so every worker of a multi-worker deployment sees them
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "local").lower()
+# Longest a knowledge-base sync waits for one running in another worker
+KB_SYNC_LOCK_TIMEOUT = float(os.getenv("KB_SYNC_LOCK_TIMEOUT", "300"))
+
+
+def shared(cache, name: str, key=None):
+    """Wrap `cache` in a SharedCache when CACHE_BACKEND is "shared".
+
+    Stored keys carry the graph version, so entries written by a worker
+    still serving an older snapshot are never read by one that refreshed.
+    """
+    if CACHE_BACKEND != "shared":
+        return cache
+    return SharedCache(
+        cache,
+        lambda: get_redis(),
+        f"{GRAPH_NAME}:{name}",
+        key,
+        version=lambda: graph_snapshot.version if graph_snapshot is not None else None,
+    )
+
+
+# Knowledge-graph context per normalized prompt; clear on every graph write
+context_cache = shared(LRUCache(maxsize=CONTEXT_CACHE_SIZE, ttl=CONTEXT_CACHE_TTL), "context")
+
+# Per-client conversation history, bounded per session and in total
+sessions = SessionStore(
+    max_sessions=SESSION_MAX_COUNT,
+    ttl=SESSION_TTL,
+    history_tokens=SESSION_HISTORY_TOKENS,
+    summary_tokens=SESSION_SUMMARY_TOKENS,
+)
+
+# Graph snapshot (facts and RELATED adjacency), BM25 index and topic
+# embeddings, rebuilt whenever the graph's version changes
+graph_snapshot = None
+keyword_index = None
+neighborhood = None
+vector_index = None
+
+# Opt-in cache of final answers, matched by exact text or n-gram similarity
+response_cache = shared(
+    ResponseCache(
+        maxsize=RESPONSE_CACHE_SIZE if RESPONSE_CACHE_ENABLED else 0,
+        ttl=RESPONSE_CACHE_TTL,
+        threshold=RESPONSE_CACHE_THRESHOLD,
+    ),
+    "response",
+    key=ResponseCache.normalize,
+)
+
+
+def clear_local_caches():
+    """Drop this worker's cached context and responses after a graph change.
+
+    Shared entries are keyed by graph version, so old ones are never read
+    again and expire with their TTL. Clearing the shared store here would
+    also delete entries other workers already wrote for the new version.
+    """
+    for cache in (context_cache, response_cache):
+        getattr(cache, "local", cache).clear()
+
+
+# Prometheus metrics, served on /metrics
+STAGE_SECONDS = Histogram(
+    "chatbot_stage_seconds",
+    "Time spent in each stage of a generation request.",
+    ("endpoint", "stage"),
+)
+REQUEST_SECONDS = Histogram(
+    "chatbot_request_seconds",
+    "End-to-end time of successful generation requests.",
+    ("endpoint", "cached"),
+)
+TIME_TO_FIRST_TOKEN_SECONDS = Histogram(
+    "chatbot_time_to_first_token_seconds",
+    "Time from receiving a streaming request to sending its first token.",
+)
+OLLAMA_PROMPT_EVAL_SECONDS = Histogram(
+    "ollama_prompt_eval_seconds",
+    "Prompt evaluation (prefill) time reported by Ollama as prompt_eval_duration.",
+)
+OLLAMA_EVAL_SECONDS = Histogram(
+    "ollama_eval_seconds",
+    "Generation time reported by Ollama as eval_duration.",
+)
+TOKEN_BUCKETS = (8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+OLLAMA_PROMPT_EVAL_TOKENS = Histogram(
+    "ollama_prompt_eval_tokens",
+    "Prompt tokens Ollama evaluated rather than reused from its cache (prompt_eval_count).",
+    buckets=TOKEN_BUCKETS,
+)
+OLLAMA_EVAL_TOKENS = Histogram(
+    "ollama_eval_tokens",
+    "Tokens generated per answer, reported by Ollama as eval_count.",
+    buckets=TOKEN_BUCKETS,
+)
+COALESCED_REQUESTS = Counter(
+    "chatbot_coalesced_requests_total",
+    "Requests answered by another identical request's generation instead of their own.",
+    ("endpoint",),
+)
+
+
+# Every Cypher statement is a fixed template with values passed as
+# parameters, so FalkorDB parses and plans each one once and reuses the
+# cached plan; user text never becomes part of the query string.
+TOPICS_BY_ID_QUERY = """
+MATCH (n:Topic)
+WHERE n.id IN $ids
+RETURN n.id AS id, n.category AS category, n.fact AS fact
+"""
+ALL_TOPICS_QUERY = "MATCH (n:Topic) RETURN n.id, n.category, n.fact"
+ALL_EDGES_QUERY = "MATCH (a:Topic)-[r:RELATED]->(b:Topic) RETURN a.id, b.id, r.relation"
+KB_VERSION_QUERY = "MATCH (m:Meta {id: 'knowledge_base'}) RETURN m.hash"
+GRAPH_VERSION_QUERY = "MATCH (m:Meta {id: 'knowledge_base'}) RETURN m.version"
+# Records the synced file and bumps the counter snapshots are keyed on
+SET_KB_VERSION_QUERY = """
+MERGE (m:Meta {id: 'knowledge_base'})
+SET m.hash = $hash, m.version = coalesce(m.version, 0) + 1
+"""
+TOPIC_ID_INDEX_QUERY = "CREATE INDEX FOR (n:Topic) ON (n.id)"
+UPSERT_TOPICS_QUERY = """
+UNWIND $rows AS row
+MERGE (n:Topic {id: row.id})
+SET n.category = row.category, n.fact = row.fact
+"""
+DELETE_EDGES_QUERY = """
+UNWIND $rows AS row
+MATCH (a:Topic {id: row.source})-[r:RELATED {relation: row.relation}]->(b:Topic {id: row.target})
+DELETE r
+"""
+DELETE_TOPICS_QUERY = """
+UNWIND $ids AS id
+MATCH (n:Topic {id: id})
+DETACH DELETE n
+"""
+MERGE_EDGES_QUERY = """
+UNWIND $rows AS row
+MATCH (a:Topic {id: row.source}), (b:Topic {id: row.target})
+MERGE (a)-[r:RELATED {relation: row.relation}]->(b)
+"""
+
+
+# Shared graph handles over bounded connection pools, created on first use:
+# one for request-time lookups and one for bulk maintenance
+_graph = None
+_bulk_graph = None
+_graph_lock = threading.Lock()
+_falkordb_retry_at = 0.0
+_falkordb_error = None
+
+
+def connect_graph(max_connections: int, timeout):
+    pool = redis.BlockingConnectionPool(
+        host=FALKORDB_HOST,
+        port=FALKORDB_PORT,
+        max_connections=max_connections,
+        timeout=timeout,
+        socket_timeout=timeout,
+        socket_connect_timeout=FALKORDB_TIMEOUT,
+        health_check_interval=30,
+        retry=Retry(ExponentialBackoff(cap=1.0, base=0.05), FALKORDB_RETRIES),
+        decode_responses=True,
+    )
+    try:
+        return falkordb.FalkorDB(connection_pool=pool).select_graph(GRAPH_NAME)
+    except (RedisError, OSError) as e:
+        pool.disconnect()
+        mark_falkordb_down(e)
+        raise
+
+
+def get_graph(bulk: bool = False):
+    """Return the shared graph handle, connecting if needed.
+
+    `bulk` selects the handle for writes and full-graph reads. Raises
+    ConnectionError immediately while a recent failure is backing off, so
+    a FalkorDB outage costs requests nothing but missing context.
+    """
+    global _graph, _bulk_graph
+    if time.monotonic() < _falkordb_retry_at:
+        raise ConnectionError(f"FalkorDB unavailable: {_falkordb_error}")
+    graph = _bulk_graph if bulk else _graph
+    if graph is not None:
+        return graph
+
+    with _graph_lock:
+        if bulk:
+            if _bulk_graph is None:
+                _bulk_graph = connect_graph(FALKORDB_BULK_POOL_SIZE, FALKORDB_BULK_TIMEOUT or None)
+            return _bulk_graph
+        if _graph is None:
+            _graph = connect_graph(FALKORDB_POOL_SIZE, FALKORDB_TIMEOUT)
+        return _graph
+
+
+def get_redis():
+    """Plain Redis client on the FalkorDB connection pool, for locks and shared caches."""
+    return get_graph().client.connection
+
+
+def mark_falkordb_down(error):
+    global _falkordb_retry_at, _falkordb_error
+    _falkordb_error = str(error)
+    _falkordb_retry_at = time.monotonic() + FALKORDB_RECONNECT_BACKOFF
+    print(f"FalkorDB unavailable, backing off {FALKORDB_RECONNECT_BACKOFF}s: {error}")
+
+
+def run_query(query: str, params: dict = None, write: bool = False, bulk: bool = False):
+    """Run one Cypher statement on a shared graph handle.
+
+    Reads go through GRAPH.RO_QUERY with FALKORDB_QUERY_TIMEOUT_MS. Writes
+    and `bulk` reads (full-graph scans) use the bulk handle and are not
+    time-limited by the server. Connection errors trip the backoff.
+    """
+    graph = get_graph(bulk=write or bulk)
+    try:
+        if write:
+            return graph.query(query, params)
+        if bulk:
+            return graph.ro_query(query, params)
+        return graph.ro_query(query, params, timeout=FALKORDB_QUERY_TIMEOUT_MS)
+    except (RedisConnectionError, RedisTimeoutError) as e:
+        mark_falkordb_down(e)
+        raise
+
+
+def check_falkordb() -> dict:
+    """Readiness probe for the / endpoint."""
+    try:
+        graph = get_graph()
+    except (RedisError, OSError) as e:
+        # Already recorded by get_graph()
+        return {"ready": False, "error": str(e)}
+    try:
+        graph.execute_command("PING")
+    except (RedisError, OSError) as e:
+        mark_falkordb_down(e)
+        return {"ready": False, "error": str(e)}
+    return {"ready": True}
+
 
-db = falkordb.FalkorDB(host=FALKORDB_HOST, port=FALKORDB_PORT)
-
-
-def setup_knowledge_graph():
-    """Initialize the knowledge graph with nodes and edges."""
-    graph = db.select_graph(GRAPH_NAME)
-
-    nodes = [
-        (
-            "python",
-            "technology",
-            "Python is a high-level, interpreted programming language known for its readability and versatility.",
-        ),
-        (
-            "machine_learning",
-            "technology",
-            "Machine learning is a subset of artificial intelligence that enables systems to learn and improve from experience.",
-        ),
-        (
-            "deep_learning",
-            "technology",
-            "Deep learning is a subset of machine learning using neural networks with multiple layers.",
-        ),
-        (
-            "neural_network",
-            "technology",
-            "A neural network is a computing system inspired by biological neural networks in the brain.",
-        ),
-        (
-            "data_science",
-            "technology",
-            "Data science combines statistics, programming, and domain expertise to extract insights from data.",
-        ),
-        (
-            "artificial_intelligence",
-            "technology",
-            "Artificial intelligence is the simulation of human intelligence by machines.",
-        ),
-        (
-            "natural_language_processing",
-            "technology",
-            "Natural language processing (NLP) helps computers understand human language.",
-        ),
-        (
-            "computer_vision",
-            "technology",
-            "Computer vision enables computers to interpret and analyze visual information from the world.",
-        ),
-        (
-            "robotics",
-            "technology",
-            "Robotics combines engineering and computer science to design and build robots.",
-        ),
-        (
-            "cloud_computing",
-            "technology",
-            "Cloud computing delivers computing services over the internet.",
-        ),
-        (
-            "blockchain",
-            "technology",
-            "Blockchain is a distributed ledger technology that records transactions across many computers.",
-        ),
-        (
-            "internet_of_things",
-            "technology",
-            "The Internet of Things (IoT) connects everyday devices to the internet.",
-        ),
-        (
-            "coffee",
-            "general",
-            "Coffee is a brewed drink made from roasted coffee beans, one of the most popular beverages worldwide.",
-        ),
-        (
-            "espresso",
-            "general",
-            "Espresso is a concentrated coffee made by forcing hot water through finely ground coffee.",
-        ),
-        (
-            "latte",
-            "general",
-            "Latte is a coffee drink made with espresso and steamed milk.",
-        ),
-        (
-            "cappuccino",
-            "general",
-            "Cappuccino is an espresso-based drink with equal parts espresso, steamed milk, and milk foam.",
-        ),
-        (
-            "cafe",
-            "general",
-            "A cafe is a small restaurant serving light meals and beverages, especially coffee.",
-        ),
-        (
-            "gaming",
-            "entertainment",
-            "Gaming is the act of playing electronic games, a popular form of entertainment worldwide.",
-        ),
-        (
-            "video_games",
-            "entertainment",
-            "Video games are electronic games played on computers or consoles.",
-        ),
-        (
-            "esports",
-            "entertainment",
-            "Esports is competitive gaming where players or teams compete in video games.",
-        ),
-        (
-            "chess",
-            "entertainment",
-            "Chess is a strategic board game played by two players on a checkered board.",
-        ),
-        (
-            "football",
-            "sports",
-            "Football (soccer) is a team sport played with a spherical ball between two teams.",
-        ),
-        (
-            "basketball",
-            "sports",
-            "Basketball is a team sport where players score points by shooting a ball through a hoop.",
-        ),
-        (
-            "tennis",
-            "sports",
-            "Tennis is a racket sport played individually or in doubles.",
-        ),
-        (
-            "swimming",
-            "sports",
-            "Swimming is moving through water using arms and legs, an Olympic sport.",
-        ),
-        (
-            "history",
-            "academic",
-            "History is the study of past events, civilizations, and societies.",
-        ),
-        (
-            "world_war_ii",
-            "academic",
-            "World War II was a global conflict from 1939 to 1945 involving most of the world's nations.",
-        ),
-        (
-            "ancient_rome",
-            "academic",
-            "Ancient Rome was a civilization that existed from 753 BC to 476 AD.",
-        ),
-        (
-            "renaissance",
-            "academic",
-            "The Renaissance was a cultural movement in Europe from the 14th to 17th centuries.",
-        ),
-        (
-            "physics",
-            "academic",
-            "Physics is the natural science studying matter, energy, and their interactions.",
-        ),
-        (
-            "chemistry",
-            "academic",
-            "Chemistry is the scientific study of substances, their properties, and reactions.",
-        ),
-        (
-            "biology",
-            "academic",
-            "Biology is the scientific study of living organisms and their interactions.",
-        ),
-        (
-            "mathematics",
-            "academic",
-            "Mathematics is the abstract science of numbers, quantity, and space.",
-        ),
-        (
-            "astronomy",
-            "academic",
-            "Astronomy is the scientific study of celestial objects and phenomena.",
-        ),
-        (
-            "universe",
-            "science",
-            "The universe is all of space, time, matter, and energy that exists.",
-        ),
-        (
-            "solar_system",
-            "science",
-            "The solar system consists of the Sun and eight planets orbiting it.",
-        ),
-        (
-            "earth",
-            "science",
-            "Earth is the third planet from the Sun and the only known planet with life.",
-        ),
-        (
-            "mars",
-            "science",
-            "Mars is the fourth planet from the Sun, known as the Red Planet.",
-        ),
-        (
-            "moon",
-            "science",
-            "The Moon is Earth's only natural satellite, orbiting our planet.",
-        ),
-        (
-            "black_hole",
-            "science",
-            "A black hole is a region in space where gravity is so strong that nothing can escape.",
-        ),
-        (
-            "galaxy",
-            "science",
-            "A galaxy is a massive system of stars, gas, and dust held together by gravity.",
-        ),
-        # Greetings & General
-        (
-            "greeting",
-            "general",
-            "A greeting is a way to say hello or acknowledge someone, like 'Hi', 'Hello', or 'Hey there!'",
-        ),
-        (
-            "how_are_you",
-            "general",
-            "People ask 'How are you?' as a friendly way to check in on someone's wellbeing.",
-        ),
-        (
-            "good_morning",
-            "general",
-            "Good morning is a greeting used in the morning hours, usually until noon.",
-        ),
-        (
-            "good_afternoon",
-            "general",
-            "Good afternoon is a greeting used from noon until evening.",
-        ),
-        (
-            "good_evening",
-            "general",
-            "Good evening is a greeting used in the evening hours.",
-        ),
-        ("good_night", "general", "Good night is used as a farewell before sleeping."),
-        ("thanks", "general", "Thanks or thank you is an expression of gratitude."),
-        ("bye", "general", "Bye is a casual farewell, short for 'Goodbye'."),
-        # Gen Z Topics
-        (
-            "skibidi",
-            "gen_z",
-            "Skibidi is a viral internet meme and sound that became popular in 2024, used humorously in videos.",
-        ),
-        (
-            "rizz",
-            "gen_z",
-            "Rizz means charisma, especially in romantic or social situations. Short for 'charisma'.",
-        ),
-        (
-            "sigma",
-            "gen_z",
-            "Sigma is a term used online to describe a lone wolf who doesn't follow social norms, often humorously.",
-        ),
-        (
-            "gyat",
-            "gen_z",
-            "Gyat is Gen Z slang meaning 'goddamn' and is often used when expressing excitement.",
-        ),
-        (
-            "no_cap",
-            "gen_z",
-            "No cap means 'no lie' or 'for real', used to emphasize honesty.",
-        ),
-        ("bet", "gen_z", "Bet is Gen Z slang meaning 'okay', 'sure', or 'let's go'."),
-        (
-            "sheesh",
-            "gen_z",
-            "Sheesh is an expression of surprise or admiration, often said in an exaggerated way.",
-        ),
-        (
-            "slay",
-            "gen_z",
-            "Slay means to do something exceptionally well or to look amazing.",
-        ),
-        (
-            "vibe",
-            "gen_z",
-            "Vibe refers to the mood or atmosphere of a situation, or someone's energy.",
-        ),
-        ("aura", "gen_z", "Aura refers to a person's energy or magnetic presence."),
-        (
-            "stan",
-            "gen_z",
-            "Stan means to be a huge fan of someone or something, from Eminem's song 'Stan'.",
-        ),
-        (
-            "goat",
-            "gen_z",
-            "GOAT means 'Greatest Of All Time', used to describe the best in any category.",
-        ),
-        ("lit", "gen_z", "Lit means something is exciting, fun, or cool."),
-        (
-            "fire",
-            "gen_z",
-            "Fire means something is really good or cool, like 'that's fire'.",
-        ),
-        (
-            "based",
-            "gen_z",
-            "Based means being true to yourself and not caring about others' opinions.",
-        ),
-        ("w", "gen_z", "W means a win or success, the opposite of L."),
-        ("L", "gen_z", "L means a loss or failure."),
-        ("yap", "gen_z", "Yap means to talk a lot, often about unimportant things."),
-        (
-            "fanum_tax",
-            "gen_z",
-            "Fanum Tax is a meme about sharing food, where someone steals part of your meal.",
-        ),
-        (
-            "brainrot",
-            "gen_z",
-            "Brainrot is Gen Z humor for content that rots your brain from too much internet use.",
-        ),
-        # Trending
-        (
-            "tiktok",
-            "social_media",
-            "TikTok is a popular short-video app where users create and share 15-60 second videos.",
-        ),
-        (
-            "instagram",
-            "social_media",
-            "Instagram is a photo and video sharing app owned by Meta.",
-        ),
-        (
-            "youtube",
-            "social_media",
-            "YouTube is a video platform where users watch and upload videos.",
-        ),
-        (
-            "minecraft",
-            "gaming",
-            "Minecraft is a popular sandbox video game where players build with blocks.",
-        ),
-        ("fortnite", "gaming", "Fortnite is a popular battle royale video game."),
-        (
-            "roblox",
-            "gaming",
-            "Roblox is a gaming platform where users create and play games made by the community.",
-        ),
-        (
-            "genshin_impact",
-            "gaming",
-            "Genshin Impact is a popular open-world action RPG game.",
-        ),
-        # Food
-        (
-            "pizza",
-            "food",
-            "Pizza is a popular food made with dough, sauce, cheese, and toppings.",
-        ),
-        (
-            "burger",
-            "food",
-            "A burger is a sandwich with a meat patty between two buns.",
-        ),
-        ("sushi", "food", "Sushi is a Japanese dish with rice, fish, and seaweed."),
-        ("ramen", "food", "Ramen is a Japanese noodle soup dish."),
-        (
-            "boba",
-            "food",
-            "Boba or bubble tea is a sweet tea drink with tapioca pearls.",
-        ),
-        (
-            "mcdonalds",
-            "food",
-            "McDonald's is a fast food restaurant chain known for burgers and fries.",
-        ),
-        (
-            "chicken_nuggets",
-            "food",
-            "Chicken nuggets are bite-sized pieces of chicken coated in breading.",
-        ),
-        # Small talk / Chitchat
-        (
-            "whats_up",
-            "chitchat",
-            "What's up is a casual greeting asking how someone is doing, similar to 'what's going on?'",
-        ),
-        (
-            "how_was_your_day",
-            "chitchat",
-            "How was your day is a friendly question asking about someone's daily experiences.",
-        ),
-        (
-            "whats_good",
-            "chitchat",
-            "What's good is Gen Z slang for asking what's happening or how someone is doing.",
-        ),
-        (
-            "you_good",
-            "chitchat",
-            "You good? is a casual way of asking if someone is okay or doing well.",
-        ),
-        (
-            "hows_life",
-            "chitchat",
-            "How's life is a casual question about someone's general wellbeing and life situation.",
-        ),
-        (
-            "what_you_been_up_to",
-            "chitchat",
-            "What have you been up to is asking what someone has been doing lately.",
-        ),
-        (
-            "lowkey",
-            "gen_z",
-            "Lowkey means secretly, quietly, or to a moderate degree. Like 'I lowkey love that song'.",
-        ),
-        (
-            "highkey",
-            "gen_z",
-            "Highkey is the opposite of lowkey, meaning obviously or very much so.",
-        ),
-        (
-            "fr_fr",
-            "gen_z",
-            "FR FR means 'for real for real', used to strongly emphasize something is true.",
-        ),
-        (
-            "ngl",
-            "gen_z",
-            "NGL means 'not gonna lie', used before an honest or vulnerable statement.",
-        ),
-        (
-            "mid",
-            "gen_z",
-            "Mid means average or mediocre, not good but not terrible either.",
-        ),
-        ("bussin", "gen_z", "Bussin means really good, usually used to describe food."),
-        (
-            "hits_different",
-            "gen_z",
-            "Hits different means something feels uniquely special or better in a particular context.",
-        ),
-        (
-            "understood_the_assignment",
-            "gen_z",
-            "Understood the assignment means someone did exactly what was needed and did it well.",
-        ),
-        (
-            "main_character",
-            "gen_z",
-            "Main character energy means acting like the protagonist of your own life story.",
-        ),
-        (
-            "rent_free",
-            "gen_z",
-            "Living rent free means something or someone is stuck in your head without you wanting it.",
-        ),
-        (
-            "era",
-            "gen_z",
-            "Era is used to describe a phase of life, like 'I'm in my study era' or 'villain era'.",
-        ),
-        (
-            "delulu",
-            "gen_z",
-            "Delulu is short for delusional, used humorously when someone has unrealistic expectations.",
-        ),
-        (
-            "touch_grass",
-            "gen_z",
-            "Touch grass means to go outside and disconnect from the internet for a while.",
-        ),
-        (
-            "ick",
-            "gen_z",
-            "The ick is a sudden feeling of disgust or being turned off by someone.",
-        ),
-        (
-            "situationship",
-            "gen_z",
-            "A situationship is a romantic relationship that isn't officially defined or labeled.",
-        ),
-        (
-            "ghosting",
-            "gen_z",
-            "Ghosting means suddenly cutting off all communication with someone without explanation.",
-        ),
-        (
-            "caught_in_4k",
-            "gen_z",
-            "Caught in 4K means being caught doing something bad with clear undeniable evidence.",
-        ),
-        (
-            "npc",
-            "gen_z",
-            "NPC means someone acting like a Non-Playable Character, doing repetitive or mindless things.",
-        ),
-        (
-            "glow_up",
-            "gen_z",
-            "Glow up means a major positive transformation in appearance or lifestyle.",
-        ),
-        (
-            "ate",
-            "gen_z",
-            "Ate (and left no crumbs) means someone did something perfectly and impressively.",
-        ),
-        (
-            "periodt",
-            "gen_z",
-            "Periodt is an emphatic version of 'period', used to end a statement with finality.",
-        ),
-        # Trivia & General Knowledge
-        (
-            "capitals",
-            "trivia",
-            "A capital city is the city where a country's government is located. Example: Tokyo is the capital of Japan, Paris is the capital of France, Manila is the capital of the Philippines.",
-        ),
-        (
-            "philippines",
-            "trivia",
-            "The Philippines is an archipelago in Southeast Asia with Manila as its capital. It has over 7,000 islands.",
-        ),
-        (
-            "largest_country",
-            "trivia",
-            "Russia is the largest country in the world by land area, covering over 17 million square kilometers.",
-        ),
-        (
-            "smallest_country",
-            "trivia",
-            "Vatican City is the smallest country in the world, located inside Rome, Italy.",
-        ),
-        (
-            "longest_river",
-            "trivia",
-            "The Nile River in Africa is often considered the longest river in the world at about 6,650 kilometers.",
-        ),
-        (
-            "tallest_mountain",
-            "trivia",
-            "Mount Everest is the tallest mountain in the world at 8,849 meters above sea level, located in Nepal.",
-        ),
-        (
-            "human_body",
-            "trivia",
-            "The human body has 206 bones, 32 teeth, and about 37 trillion cells. The heart beats about 100,000 times a day.",
-        ),
-        (
-            "speed_of_light",
-            "trivia",
-            "The speed of light is approximately 299,792 kilometers per second. Nothing in the universe travels faster.",
-        ),
-        (
-            "water_formula",
-            "trivia",
-            "Water is made of two hydrogen atoms and one oxygen atom, chemical formula H2O. It covers 71% of Earth's surface.",
-        ),
-        (
-            "planets_count",
-            "trivia",
-            "There are 8 planets in our solar system: Mercury, Venus, Earth, Mars, Jupiter, Saturn, Uranus, and Neptune.",
-        ),
-        (
-            "dna",
-            "trivia",
-            "DNA stands for deoxyribonucleic acid and carries genetic information in living organisms. It is shaped like a double helix.",
-        ),
-        (
-            "gravity",
-            "trivia",
-            "Gravity is the force that attracts objects toward each other. Earth's gravity pulls things downward at 9.8 m/s².",
-        ),
-        (
-            "photosynthesis",
-            "trivia",
-            "Photosynthesis is the process plants use to convert sunlight, water, and CO2 into food and oxygen.",
-        ),
-        (
-            "boiling_point",
-            "trivia",
-            "Water boils at 100 degrees Celsius or 212 degrees Fahrenheit at sea level.",
-        ),
-        (
-            "freezing_point",
-            "trivia",
-            "Water freezes at 0 degrees Celsius or 32 degrees Fahrenheit.",
-        ),
-        (
-            "continents",
-            "trivia",
-            "There are 7 continents on Earth: Africa, Antarctica, Asia, Australia, Europe, North America, and South America.",
-        ),
-        (
-            "oceans",
-            "trivia",
-            "There are 5 oceans on Earth: Pacific, Atlantic, Indian, Southern, and Arctic. The Pacific is the largest.",
-        ),
-        (
-            "world_population",
-            "trivia",
-            "The world population is approximately 8 billion people as of 2024.",
-        ),
-        (
-            "light_year",
-            "trivia",
-            "A light year is the distance light travels in one year, about 9.46 trillion kilometers.",
-        ),
-        (
-            "periodic_table",
-            "trivia",
-            "The periodic table has 118 elements. Hydrogen is the lightest and most abundant element in the universe.",
-        ),
-        # Simple Math & Logic
-        (
-            "addition",
-            "math",
-            "Addition is combining numbers together. Example: 2 + 2 = 4. The result is called the sum.",
-        ),
-        (
-            "subtraction",
-            "math",
-            "Subtraction is taking one number away from another. Example: 10 - 3 = 7. The result is called the difference.",
-        ),
-        (
-            "multiplication",
-            "math",
-            "Multiplication is repeated addition. Example: 4 x 3 = 12. The result is called the product.",
-        ),
-        (
-            "division",
-            "math",
-            "Division is splitting a number into equal parts. Example: 12 / 4 = 3. The result is called the quotient.",
-        ),
-        (
-            "percentage",
-            "math",
-            "A percentage represents a fraction of 100. To find X% of a number: multiply by X then divide by 100. Example: 20% of 50 = (50 x 20) / 100 = 10.",
-        ),
-        (
-            "area",
-            "math",
-            "Area is the amount of space inside a 2D shape. Rectangle: length x width. Circle: π x radius². Triangle: 0.5 x base x height.",
-        ),
-        (
-            "perimeter",
-            "math",
-            "Perimeter is the total distance around a shape. Rectangle: 2 x (length + width). Circle circumference: 2 x π x radius.",
-        ),
-        (
-            "pythagorean_theorem",
-            "math",
-            "The Pythagorean theorem states a² + b² = c² for right triangles, where c is the hypotenuse (longest side).",
-        ),
-        (
-            "average",
-            "math",
-            "Average (mean) is the sum of all numbers divided by the count. Example: average of 2, 4, 6 = (2+4+6)/3 = 4.",
-        ),
-        (
-            "prime_numbers",
-            "math",
-            "Prime numbers are only divisible by 1 and themselves. Examples: 2, 3, 5, 7, 11, 13, 17, 19, 23.",
-        ),
-        (
-            "square_root",
-            "math",
-            "A square root is a number that when multiplied by itself gives the original number. Example: √16 = 4 because 4 x 4 = 16.",
-        ),
-        (
-            "fractions",
-            "math",
-            "A fraction represents part of a whole. Example: 1/2 means one out of two equal parts. To add fractions, make denominators equal first.",
-        ),
-        (
-            "order_of_operations",
-            "math",
-            "Order of operations (PEMDAS): Parentheses, Exponents, Multiplication/Division (left to right), Addition/Subtraction (left to right).",
-        ),
-        (
-            "negative_numbers",
-            "math",
-            "Negative numbers are less than zero. Adding a negative = subtracting. Multiplying two negatives = positive.",
-        ),
-        (
-            "exponents",
-            "math",
-            "An exponent means multiplying a number by itself. Example: 2³ = 2 x 2 x 2 = 8. Any number to the power of 0 = 1.",
-        ),
-        # Everyday Problem Solving
-        (
-            "time_zones",
-            "practical",
-            "Time zones divide the world into 24 regions. The Philippines is in UTC+8. New York is UTC-5. London is UTC+0.",
-        ),
-        (
-            "unit_conversion",
-            "practical",
-            "Unit conversion: 1 kilometer = 1000 meters. 1 mile = 1.609 km. 1 inch = 2.54 cm. 1 kg = 2.205 pounds. 1 liter = 1000 ml.",
-        ),
-        (
-            "cooking_tips",
-            "practical",
-            "Common cooking tips: preheat oven before baking. 1 cup = 240ml. 1 tablespoon = 15ml. 1 teaspoon = 5ml.",
-        ),
-        (
-            "budgeting",
-            "practical",
-            "Budgeting means tracking income and expenses. The 50/30/20 rule: 50% needs, 30% wants, 20% savings.",
-        ),
-        (
-            "password_tips",
-            "practical",
-            "A strong password uses uppercase, lowercase, numbers, and symbols and is at least 12 characters long. Never reuse passwords.",
-        ),
-        (
-            "file_sizes",
-            "practical",
-            "File sizes: 1 KB = 1024 bytes, 1 MB = 1024 KB, 1 GB = 1024 MB, 1 TB = 1024 GB.",
-        ),
-        (
-            "internet_speed",
-            "practical",
-            "Internet speed is measured in Mbps. Streaming HD video needs ~5 Mbps. 4K needs ~25 Mbps. Gaming needs ~10 Mbps.",
-        ),
-        (
-            "first_aid",
-            "practical",
-            "Basic first aid: for cuts, clean the wound and apply pressure. For burns, run cool water for 10 minutes. For choking, use the Heimlich maneuver.",
-        ),
-        (
-            "sleep_tips",
-            "practical",
-            "Adults need 7-9 hours of sleep per night. Avoid screens 1 hour before bed. Keep a consistent sleep schedule for better rest.",
-        ),
-        (
-            "study_tips",
-            "practical",
-            "Effective study tips: use the Pomodoro technique (25 min study, 5 min break). Take notes, review regularly, and teach concepts to others.",
-        ),
-        (
-            "temperature_conversion",
-            "practical",
-            "To convert Celsius to Fahrenheit: multiply by 9/5 then add 32. To convert Fahrenheit to Celsius: subtract 32 then multiply by 5/9.",
-        ),
-        (
-            "time_management",
-            "practical",
-            "Time management tips: prioritize tasks by urgency and importance. Break big tasks into smaller steps. Avoid multitasking.",
-        ),
-        (
-            "money_tips",
-            "practical",
-            "Money tips: track your spending, avoid impulse buys, build an emergency fund with 3-6 months of expenses, and invest early.",
-        ),
-        # Logic & Reasoning
-        (
-            "logical_thinking",
-            "logic",
-            "Logical thinking involves analyzing facts and drawing conclusions based on evidence, not emotions or assumptions.",
-        ),
-        (
-            "cause_and_effect",
-            "logic",
-            "Cause and effect means one event causes another. Example: if it rains (cause), the ground gets wet (effect).",
-        ),
-        (
-            "if_then",
-            "logic",
-            "If-then logic: If a condition is true, then a result follows. Example: If 2+2=4, then it is a true equation.",
-        ),
-        (
-            "deduction",
-            "logic",
-            "Deduction is drawing specific conclusions from general rules. Example: All humans are mortal, Socrates is human, so Socrates is mortal.",
-        ),
-        (
-            "problem_solving_steps",
-            "logic",
-            "Problem solving steps: 1) Identify the problem clearly, 2) Gather relevant information, 3) Think of possible solutions, 4) Pick the best one, 5) Evaluate results.",
-        ),
-        (
-            "critical_thinking",
-            "logic",
-            "Critical thinking means questioning assumptions, evaluating evidence, and considering multiple perspectives before reaching a conclusion.",
-        ),
-        (
-            "analogy",
-            "logic",
-            "An analogy compares two things to explain a concept. Example: A heart is to the body as a pump is to a water system.",
-        ),
-        (
-            "pattern_recognition",
-            "logic",
-            "Pattern recognition is identifying repeating sequences. Example: 2, 4, 6, 8 — the pattern is adding 2 each time.",
-        ),
+def _batches(rows, size):
+    for i in range(0, len(rows), size):
+        yield rows[i : i + size]
+
+
+def read_graph_state():
+    """Read all topics and edges currently in the graph."""
+    result = run_query(ALL_TOPICS_QUERY, bulk=True)
+    topics = {row[0]: (row[1], row[2]) for row in result.result_set}
+    result = run_query(ALL_EDGES_QUERY, bulk=True)
+    edges = {(row[0], row[1], row[2]) for row in result.result_set}
+    return topics, edges
+
+
+def apply_knowledge_base_diff(topics, diff):
+    """Write only the added, changed and removed topics and edges."""
+    upserts = [
+        {"id": tid, "category": topics[tid][0], "fact": topics[tid][1]}
+        for tid in diff["added"] + diff["changed"]
     ]
+    for rows in _batches(upserts, KB_BATCH_SIZE):
+        run_query(UPSERT_TOPICS_QUERY, {"rows": rows}, write=True)
 
-    edges = [
-        ("python", "machine_learning", "used_in"),
-        ("python", "data_science", "used_in"),
-        ("python", "deep_learning", "used_in"),
-        ("machine_learning", "deep_learning", "is_subset_of"),
-        ("machine_learning", "neural_network", "uses"),
-        ("machine_learning", "artificial_intelligence", "is_subset_of"),
-        ("deep_learning", "neural_network", "based_on"),
-        ("deep_learning", "natural_language_processing", "enables"),
-        ("deep_learning", "computer_vision", "enables"),
-        ("artificial_intelligence", "natural_language_processing", "includes"),
-        ("artificial_intelligence", "computer_vision", "includes"),
-        ("artificial_intelligence", "robotics", "powers"),
-        ("artificial_intelligence", "data_science", "related_to"),
-        ("cloud_computing", "artificial_intelligence", "provides_infrastructure"),
-        ("internet_of_things", "cloud_computing", "connects_to"),
-        ("coffee", "espresso", "used_to_make"),
-        ("coffee", "latte", "used_in"),
-        ("coffee", "cappuccino", "used_in"),
-        ("espresso", "latte", "base_for"),
-        ("espresso", "cappuccino", "base_for"),
-        ("cafe", "coffee", "serves"),
-        ("cafe", "espresso", "serves"),
-        ("cafe", "latte", "serves"),
-        ("gaming", "video_games", "includes"),
-        ("gaming", "esports", "has"),
-        ("video_games", "esports", "played_in"),
-        ("chess", "gaming", "is_a"),
-        ("football", "sports", "is_a"),
-        ("basketball", "sports", "is_a"),
-        ("tennis", "sports", "is_a"),
-        ("swimming", "sports", "is_a"),
-        ("history", "world_war_ii", "includes"),
-        ("history", "ancient_rome", "includes"),
-        ("history", "renaissance", "includes"),
-        ("physics", "astronomy", "related_to"),
-        ("chemistry", "biology", "related_to"),
-        ("biology", "astronomy", "related_to"),
-        ("mathematics", "physics", "used_in"),
-        ("mathematics", "chemistry", "used_in"),
-        ("mathematics", "computer_vision", "used_in"),
-        ("universe", "solar_system", "contains"),
-        ("solar_system", "earth", "contains"),
-        ("solar_system", "mars", "contains"),
-        ("earth", "moon", "has"),
-        ("solar_system", "galaxy", "part_of"),
-        ("universe", "galaxy", "contains"),
-        ("universe", "black_hole", "contains"),
-        ("astronomy", "black_hole", "studies"),
-        ("astronomy", "galaxy", "studies"),
-        # Gen Z connections
-        ("rizz", "social_media", "often_discussed_on"),
-        ("skibidi", "tiktok", "popular_on"),
-        ("stan", "tiktok", "used_on"),
-        ("gyat", "tiktok", "popular_on"),
-        ("brainrot", "tiktok", "originates_from"),
-        # Gaming connections
-        ("gaming", "minecraft", "includes"),
-        ("gaming", "fortnite", "includes"),
-        ("gaming", "roblox", "includes"),
-        ("gaming", "genshin_impact", "includes"),
-        # Food connections
-        ("pizza", "mcdonalds", "sold_at"),
-        ("burger", "mcdonalds", "sold_at"),
-        ("coffee", "cafe", "served_at"),
-        ("boba", "cafe", "sold_at"),
-        ("ramen", "cafe", "served_at"),
-        ("sushi", "cafe", "served_at"),
-        # Chitchat connections
-        ("whats_up", "greeting", "is_a"),
-        ("whats_good", "greeting", "is_a"),
-        ("you_good", "greeting", "is_a"),
-        ("hows_life", "greeting", "is_a"),
-        ("how_was_your_day", "chitchat", "is_a"),
-        ("what_you_been_up_to", "chitchat", "is_a"),
-        # New gen_z connections
-        ("lowkey", "tiktok", "popular_on"),
-        ("highkey", "tiktok", "popular_on"),
-        ("delulu", "tiktok", "popular_on"),
-        ("situationship", "tiktok", "popular_on"),
-        ("npc", "gaming", "originates_from"),
-        ("glow_up", "social_media", "popular_on"),
-        ("ghosting", "situationship", "related_to"),
-        ("main_character", "tiktok", "popular_on"),
-        ("era", "tiktok", "popular_on"),
-        # Trivia connections
-        ("gravity", "physics", "is_part_of"),
-        ("photosynthesis", "biology", "is_part_of"),
-        ("dna", "biology", "is_part_of"),
-        ("water_formula", "chemistry", "is_part_of"),
-        ("speed_of_light", "physics", "is_part_of"),
-        ("tallest_mountain", "earth", "located_on"),
-        ("longest_river", "earth", "located_on"),
-        ("planets_count", "solar_system", "describes"),
-        ("boiling_point", "chemistry", "related_to"),
-        ("freezing_point", "chemistry", "related_to"),
-        ("philippines", "capitals", "has_capital"),
-        ("continents", "earth", "part_of"),
-        ("oceans", "earth", "part_of"),
-        ("periodic_table", "chemistry", "is_part_of"),
-        ("light_year", "astronomy", "used_in"),
-        # Math connections
-        ("addition", "mathematics", "is_part_of"),
-        ("subtraction", "mathematics", "is_part_of"),
-        ("multiplication", "mathematics", "is_part_of"),
-        ("division", "mathematics", "is_part_of"),
-        ("percentage", "mathematics", "is_part_of"),
-        ("area", "mathematics", "is_part_of"),
-        ("perimeter", "mathematics", "is_part_of"),
-        ("pythagorean_theorem", "mathematics", "is_part_of"),
-        ("average", "mathematics", "is_part_of"),
-        ("prime_numbers", "mathematics", "is_part_of"),
-        ("square_root", "mathematics", "is_part_of"),
-        ("fractions", "mathematics", "is_part_of"),
-        ("order_of_operations", "mathematics", "is_part_of"),
-        ("negative_numbers", "mathematics", "is_part_of"),
-        ("exponents", "mathematics", "is_part_of"),
-        # Logic connections
-        ("logical_thinking", "problem_solving_steps", "uses"),
-        ("cause_and_effect", "logical_thinking", "is_part_of"),
-        ("if_then", "logical_thinking", "is_part_of"),
-        ("deduction", "logical_thinking", "is_part_of"),
-        ("problem_solving_steps", "logical_thinking", "requires"),
-        ("critical_thinking", "logical_thinking", "is_part_of"),
-        ("analogy", "logical_thinking", "is_part_of"),
-        ("pattern_recognition", "logical_thinking", "is_part_of"),
-        # Practical connections
-        ("budgeting", "mathematics", "uses"),
-        ("unit_conversion", "mathematics", "uses"),
-        ("study_tips", "logical_thinking", "applies"),
-        ("temperature_conversion", "mathematics", "uses"),
-        ("time_management", "problem_solving_steps", "applies"),
-        ("money_tips", "budgeting", "related_to"),
-        ("cooking_tips", "unit_conversion", "uses"),
+    removed_edges = [
+        {"source": source, "target": target, "relation": relation}
+        for source, target, relation in diff["edges_removed"]
     ]
+    for rows in _batches(removed_edges, KB_BATCH_SIZE):
+        run_query(DELETE_EDGES_QUERY, {"rows": rows}, write=True)
 
-    try:
-        for node_id, category, fact in nodes:
-            query = """
-            MERGE (n:Topic {id: $id})
-            SET n.category = $category, n.fact = $fact
-            """
-            graph.query(query, {"id": node_id, "category": category, "fact": fact})
-
-        for source, target, relation in edges:
-            query = """
-            MATCH (a:Topic {id: $source}), (b:Topic {id: $target})
-            MERGE (a)-[r:RELATED {relation: $relation}]->(b)
-            """
-            graph.query(
-                query, {"source": source, "target": target, "relation": relation}
-            )
+    for ids in _batches(diff["removed"], KB_BATCH_SIZE):
+        run_query(DELETE_TOPICS_QUERY, {"ids": ids}, write=True)
+
+    added_edges = [
+        {"source": source, "target": target, "relation": relation}
+        for source, target, relation in diff["edges_added"]
+    ]
+    for rows in _batches(added_edges, KB_BATCH_SIZE):
+        run_query(MERGE_EDGES_QUERY, {"rows": rows}, write=True)
 
-        print(
-            f"Knowledge graph '{GRAPH_NAME}' initialized with {len(nodes)} nodes and {len(edges)} edges"
+
+def setup_knowledge_graph(force: bool = False):
+    """Sync the graph with the knowledge-base file at KB_PATH.
+
+    The file's content hash is kept on a :Meta node; an unchanged file is
+    skipped after one query unless `force` is set. Otherwise the file is
+    diffed against the graph and only the differences are written, in
+    batched UNWIND queries. Returns a summary of the changes, or None if
+    nothing was done.
+
+    The graph write holds a lock on the FalkorDB instance, so when several
+    workers start together one of them writes and the rest wait, then find
+    the graph up to date. The caches are cleared once the new version is
+    published and this worker's snapshot rebuilt from it.
+    """
+    written = False
+
+    try:
+        lock = get_redis().lock(
+            f"{GRAPH_NAME}:kb_sync",
+            timeout=KB_SYNC_LOCK_TIMEOUT,
+            blocking_timeout=KB_SYNC_LOCK_TIMEOUT,
         )
-    except Exception as e:
-        print(f"Graph might already exist: {e}")
-
-
-SMALL_TALK_PATTERNS = {
-    "hi": ["greeting", "how_are_you", "hello", "hey"],
-    "hello": ["greeting", "how_are_you", "hi", "hey"],
-    "hey": ["greeting", "how_are_you", "hi", "hello"],
-    "how are you": ["how_are_you", "you_good", "whats_up"],
-    "how's your day": ["how_was_your_day", "hows_life"],
-    "good morning": ["good_morning", "greeting"],
-    "good afternoon": ["good_afternoon", "greeting"],
-    "good evening": ["good_evening", "greeting"],
-    "good night": ["good_night", "bye"],
-    "bye": ["bye", "good_night"],
-    "thanks": ["thanks", "thank_you"],
-    "thank you": ["thanks", "thank_you"],
-    "what's up": ["whats_up", "whats_good", "you_good"],
-    "whats up": ["whats_up", "whats_good", "you_good"],
-    # Problem solving & trivia triggers
-    "what is": ["logical_thinking", "problem_solving_steps"],
-    "what are": ["logical_thinking", "problem_solving_steps"],
-    "how do i": ["problem_solving_steps", "study_tips"],
-    "how to": ["problem_solving_steps", "cooking_tips"],
-    "calculate": ["mathematics", "addition", "multiplication"],
-    "compute": ["mathematics", "addition", "multiplication"],
-    "convert": ["unit_conversion", "temperature_conversion"],
-    "capital of": ["capitals", "philippines"],
-    "how many": ["human_body", "planets_count", "continents"],
-    "formula": ["pythagorean_theorem", "area", "perimeter"],
-    "percentage": ["percentage", "mathematics"],
-    "average": ["average", "mathematics"],
-    "square root": ["square_root", "mathematics"],
-    "prime": ["prime_numbers", "mathematics"],
-    "solve": ["problem_solving_steps", "mathematics"],
-    "explain": ["logical_thinking", "critical_thinking"],
-    "difference between": ["logical_thinking", "critical_thinking"],
-    "why is": ["cause_and_effect", "logical_thinking"],
-    "how does": ["cause_and_effect", "logical_thinking"],
-    "what causes": ["cause_and_effect", "logical_thinking"],
-    "planet": ["planets_count", "solar_system"],
-    "ocean": ["oceans", "earth"],
-    "continent": ["continents", "earth"],
-    "country": ["capitals", "largest_country"],
-    "temperature": ["temperature_conversion", "boiling_point", "freezing_point"],
-    "speed of light": ["speed_of_light", "physics"],
-    "dna": ["dna", "biology"],
-    "gravity": ["gravity", "physics"],
-    "photosynthesis": ["photosynthesis", "biology"],
-    "water": ["water_formula", "chemistry"],
-    "budget": ["budgeting", "money_tips"],
-    "save money": ["budgeting", "money_tips"],
-    "study": ["study_tips", "time_management"],
-    "sleep": ["sleep_tips"],
-    "password": ["password_tips"],
-    "file size": ["file_sizes"],
-    "internet": ["internet_speed"],
-    "first aid": ["first_aid"],
-    "time zone": ["time_zones"],
-}
-
-
-def query_knowledge_graph(query: str, max_results: int = 3) -> str:
-    """Query the knowledge graph for relevant facts."""
-    graph = db.select_graph(GRAPH_NAME)
-    query_lower = query.lower()
-
-    # Check for small talk patterns first
-    for pattern, topic_ids in SMALL_TALK_PATTERNS.items():
-        if pattern in query_lower:
-            topic_search = " OR ".join([f"n.id = '{tid}'" for tid in topic_ids])
-            cypher_query = f"""
-            MATCH (n:Topic)
-            WHERE {topic_search}
-            RETURN n.id AS id, n.category AS category, n.fact AS fact
-            LIMIT {max_results}
-            """
+        with lock:
+            version = file_hash(KB_PATH)
+            if not force:
+                result = run_query(KB_VERSION_QUERY)
+                if result.result_set and result.result_set[0][0] == version:
+                    print(f"Knowledge graph '{GRAPH_NAME}' is up to date ({version[:12]})")
+                    return None
+
             try:
-                result = graph.query(cypher_query)
-                if result.result_set:
-                    facts = [row[2] for row in result.result_set if row[2]]
-                    if facts:
-                        context_parts = [f"- {fact}" for fact in facts]
-                        return "Relevant facts from knowledge base:\n" + "\n".join(
-                            context_parts
-                        )
-            except Exception as e:
-                print(f"Small talk query error: {e}")
-
-    # Fall back to keyword search
-    query_words = query_lower.split()
-    search_terms = " OR ".join(
-        [
-            f"n.id CONTAINS '{word}' OR n.fact CONTAINS '{word}'"
-            for word in query_words[:5]
-        ]
-    )
+                run_query(TOPIC_ID_INDEX_QUERY, write=True)
+            except Exception:
+                pass  # Index already exists
 
-    cypher_query = f"""
-    MATCH (n:Topic)
-    WHERE {search_terms}
-    RETURN n.id AS id, n.category AS category, n.fact AS fact
-    LIMIT {max_results}
-    """
+            topics, edges = read_knowledge_base(KB_PATH)
+            current_topics, current_edges = read_graph_state()
+            diff = diff_knowledge_base(current_topics, current_edges, topics, edges)
+            written = True
+            apply_knowledge_base_diff(topics, diff)
+
+            run_query(SET_KB_VERSION_QUERY, {"hash": version}, write=True)
+        # Outside the lock: rebuilding this worker's indexes, embeddings
+        # included, can outlast its timeout, and other workers needn't wait
+        refresh_retrieval_index()
+        summary = {
+            "version": version,
+            "topics": len(topics),
+            "added": len(diff["added"]),
+            "changed": len(diff["changed"]),
+            "removed": len(diff["removed"]),
+            "edges_added": len(diff["edges_added"]),
+            "edges_removed": len(diff["edges_removed"]),
+            "edges_skipped": diff["edges_skipped"],
+        }
+        print(f"Knowledge graph '{GRAPH_NAME}' synced from {KB_PATH}: {summary}")
+        return summary
+    except Exception as e:
+        print(f"Knowledge graph setup failed: {e}")
+        return None
+    finally:
+        if written:
+            clear_local_caches()
+
+
+def make_embedder():
+    if VECTOR_RETRIEVAL == "hash":
+        return HashingEmbedder(dim=EMBEDDING_DIM)
+    if VECTOR_RETRIEVAL == "ollama":
+        return OllamaEmbedder(OLLAMA_BASE_URLS[0], EMBEDDING_MODEL, timeout=OLLAMA_TIMEOUT)
+    return None
 
+
+def read_graph_version():
+    """The graph's version counter, or None if it has never been synced."""
+    result = run_query(GRAPH_VERSION_QUERY)
+    return result.result_set[0][0] if result.result_set else None
+
+
+def refresh_retrieval_index():
+    """Rebuild the snapshot, keyword index and embeddings from the graph."""
+    global graph_snapshot, keyword_index, neighborhood, vector_index
     try:
-        result = graph.query(cypher_query)
-        if result.result_set:
-            facts = [row[2] for row in result.result_set if row[2]]
-            if facts:
-                context_parts = [f"- {fact}" for fact in facts]
-                return "Relevant facts from knowledge base:\n" + "\n".join(
-                    context_parts
-                )
+        # Version first: a write that lands mid-read bumps it past this one,
+        # so the next check rebuilds again
+        version = read_graph_version()
+        topics, edges = read_graph_state()
     except Exception as e:
-        print(f"Query error: {e}")
+        print(f"Retrieval index refresh failed: {e}")
+        return None
+    graph_snapshot = GraphSnapshot(topics, edges, version)
+    neighborhood = graph_snapshot.neighborhood
+    keyword_index = InvertedIndex(topics)
+
+    embedder = make_embedder()
+    if embedder is not None:
+        try:
+            vector_index = VectorIndex.build(topics, embedder, EMBEDDINGS_PATH)
+        except Exception as e:
+            # Keyword retrieval still works; keep any previous vectors
+            print(f"Embedding index refresh failed: {e}")
+    return keyword_index
+
+
+async def watch_knowledge_base(interval: float):
+    """Poll KB_PATH and resync the graph when the file changes."""
+    last_mtime = None
+    while True:
+        try:
+            mtime = os.stat(KB_PATH).st_mtime
+            if last_mtime is not None and mtime != last_mtime:
+                await asyncio.to_thread(setup_knowledge_graph)
+            last_mtime = mtime
+        except OSError as e:
+            print(f"Knowledge base watch error: {e}")
+        await asyncio.sleep(interval)
+
+
+async def watch_graph_version(interval: float):
+    """Poll the graph's version counter and rebuild the snapshot when it moves.
+
+    Picks up writes made outside this process, such as `python server.py load-kb`
+    or another server instance syncing the file.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            version = await asyncio.to_thread(read_graph_version)
+        except Exception:
+            continue  # FalkorDB is down; keep serving the current snapshot
+        if graph_snapshot is not None and version == graph_snapshot.version:
+            continue
+        stale = graph_snapshot is not None
+        if await asyncio.to_thread(refresh_retrieval_index) is not None and stale:
+            print(f"Graph snapshot refreshed to version {version}")
+            clear_local_caches()
+
+
+def query_knowledge_graph(query: str, max_results: int = 3) -> list:
+    """Query the knowledge graph for relevant facts, best first, cached per prompt."""
+    key = (normalize_prompt(query), max_results)
+    facts = context_cache.get(key)
+    if facts is not None:
+        return facts
+
+    snapshot = graph_snapshot
+    facts, ok = search_knowledge_graph(key[0], max_results)
+    # Don't pin a failed lookup in the cache for the whole TTL, nor one
+    # made against a snapshot replaced (and the cache cleared) meanwhile
+    if ok and graph_snapshot is snapshot:
+        context_cache.set(key, facts)
+    return facts
+
+
+def query_knowledge_graph_batch(queries: list, max_results: int = 3) -> list:
+    """Facts for each of `queries`, with every uncached lookup in one graph query."""
+    keys = [(normalize_prompt(query), max_results) for query in queries]
+    results = [context_cache.get(key) for key in keys]
+    snapshot = graph_snapshot
+
+    pending = list(dict.fromkeys(key for key, facts in zip(keys, results) if facts is None))
+    if len(pending) > 1:
+        # Each ranking can wait up to RETRIEVAL_BUDGET_MS on a background
+        # retriever, so rank side by side and the batch waits about one budget.
+        # More at once than max_pending would only get the vector call skipped.
+        workers = min(len(pending), retrieval_pipeline.max_pending)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rank") as pool:
+            ranked = dict(zip(pending, pool.map(lambda key: rank_context_topics(*key), pending)))
+    else:
+        ranked = {key: rank_context_topics(*key) for key in pending}
+    topic_ids = list(dict.fromkeys(tid for ids, _ok in ranked.values() for tid in ids))
+
+    facts_by_id = {}
+    fetched = True
+    if topic_ids:
+        try:
+            facts_by_id = fetch_facts(topic_ids)
+        except Exception as e:
+            print(f"Query error: {e}")
+            fetched = False
+
+    found = {}
+    for key, (ids, ok) in ranked.items():
+        found[key] = [facts_by_id[tid] for tid in ids if tid in facts_by_id]
+        if ok and fetched and graph_snapshot is snapshot:
+            context_cache.set(key, found[key])
+    return [facts if facts is not None else found[key] for key, facts in zip(keys, results)]
+
+
+def fetch_facts(topic_ids: list) -> dict:
+    """Fetch the facts for topic_ids in one lookup, as id -> fact."""
+    snapshot = graph_snapshot
+    if GRAPH_SNAPSHOT and snapshot is not None:
+        return snapshot.fetch_facts(topic_ids)
+    # Read through to FalkorDB until the first snapshot is built
+    result = run_query(TOPICS_BY_ID_QUERY, {"ids": topic_ids})
+    return {row[0]: row[2] for row in result.result_set if row[2]}
+
+
+def pattern_candidates(query: str, k: int) -> list:
+    return [(tid, 1.0) for tid in SMALL_TALK_MATCHER.topic_ids(query)[: k * 2]]
 
-    return ""
 
+def keyword_candidates(query: str, k: int) -> list:
+    if keyword_index is None:
+        return []
+    return relative_cutoff(keyword_index.search(query, k * 2), RETRIEVAL_MIN_SCORE_RATIO)
 
-setup_knowledge_graph()
+
+def vector_candidates(query: str, k: int) -> list:
+    if vector_index is None:
+        return []
+    return vector_index.search(query, k * 2, VECTOR_MIN_SCORE)
+
+
+# Small-talk patterns, BM25 and (optionally) embeddings, fused by rank
+retrieval_pipeline = RetrievalPipeline(
+    budget=RETRIEVAL_BUDGET_MS / 1000, min_score_ratio=RETRIEVAL_FUSED_MIN_RATIO
+)
+retrieval_pipeline.add("pattern", pattern_candidates)
+retrieval_pipeline.add("lexical", keyword_candidates)
+if VECTOR_RETRIEVAL != "off":
+    # Ollama embeddings are a network call, so they run under the deadline
+    retrieval_pipeline.add("vector", vector_candidates, background=VECTOR_RETRIEVAL == "ollama")
+
+
+def rank_context_topics(query_lower: str, max_results: int = 3):
+    """Topic ids to fetch for the query, best first.
+
+    Returns (topic_ids, ok) where ok is False if the retrieval index could
+    not be built from the graph.
+    """
+    index = keyword_index if keyword_index is not None else refresh_retrieval_index()
+    ranked = retrieval_pipeline.run(query_lower, max_results)
+
+    # Neighbors come from the in-memory adjacency and ride along in the same fetch
+    if CONTEXT_EXPANSION_HOPS > 0 and neighborhood is not None and ranked:
+        ranked += neighborhood.expand(
+            ranked, CONTEXT_EXPANSION_HOPS, CONTEXT_EXPANSION_TOKENS
+        )
+    return [tid for tid, _score in ranked], index is not None
+
+
+def search_knowledge_graph(query_lower: str, max_results: int = 3):
+    """Rank topics for the query and fetch their facts in one lookup.
+
+    Returns (facts, ok) where facts are in rank order and ok is False if
+    the graph could not be read.
+    """
+    topic_ids, ok = rank_context_topics(query_lower, max_results)
+    if topic_ids:
+        try:
+            facts_by_id = fetch_facts(topic_ids)
+            return [facts_by_id[tid] for tid in topic_ids if tid in facts_by_id], ok
+        except Exception as e:
+            print(f"Query error: {e}")
+            ok = False
+
+    return [], ok
 
 
 class GenerateRequest(BaseModel):
     prompt: str
+    # Optional client-chosen id; turns with the same id share history
+    session_id: Optional[str] = None
+    # Include per-stage timings in the response
+    timings: bool = False
 
 
 class GenerateResponse(BaseModel):
     response: str
     context_used: bool = False
+    cached: bool = False
+    session_id: Optional[str] = None
+    # Estimated size of the prompt sent to the model, None for cached answers
+    prompt_tokens: Optional[int] = None
+    # Stage durations in ms and Ollama's counters, if the request asked for them
+    timings: Optional[dict] = None
+
+
+class BatchRequest(BaseModel):
+    prompts: List[str]
 
 
 @app.get("/")
 async def root():
-    return {"status": "running", "model": MODEL_NAME, "graph": GRAPH_NAME}
+    falkordb_status = await asyncio.to_thread(check_falkordb)
+    return {
+        "status": "running" if falkordb_status["ready"] else "degraded",
+        "falkordb": falkordb_status,
+        "model": MODEL_NAME,
+        "graph": GRAPH_NAME,
+        "snapshot": {
+            "enabled": GRAPH_SNAPSHOT,
+            **(graph_snapshot.stats() if graph_snapshot is not None else {}),
+        },
+        "context_cache": context_cache.stats(),
+        "retrievers": retrieval_pipeline.stats(),
+        "response_cache": {"enabled": RESPONSE_CACHE_ENABLED, **response_cache.stats()},
+        "scheduler": scheduler.stats(),
+        "coalescing": {
+            "enabled": REQUEST_COALESCING,
+            "generations": flights.stats(),
+            "lookups": lookup_flights.stats(),
+        },
+        "sessions": sessions.stats(),
+        "backends": ollama_backends.stats() if ollama_backends else [],
+    }
 
 
 SYSTEM_PROMPT = """You are a friendly, helpful, and conversational AI assistant. 
@@ -1118,49 +795,344 @@ You give clear and concise answers.
 You use a casual but professional tone. 
 If you don't know something, you honestly say you don't know.
 You are enthusiastic and enjoy helping people learn new things."""
+SYSTEM_PROMPT_TOKENS = estimate_tokens(SYSTEM_PROMPT)
 
 
-@app.post("/generate", response_model=GenerateResponse)
-async def generate(request: GenerateRequest):
-    try:
-        context = query_knowledge_graph(request.prompt)
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Latency histograms in the Prometheus text format."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
-        # Build prompt with system prompt and context
-        if context:
-            full_prompt = f"""{SYSTEM_PROMPT}
 
-Relevant facts from knowledge base:
-{context}
+@app.post("/reload")
+async def reload_knowledge_base(force: bool = False):
+    """Re-read KB_PATH and apply only what changed to the graph."""
+    summary = await asyncio.to_thread(setup_knowledge_graph, force)
+    return {"reloaded": summary is not None, "changes": summary}
 
-User: {request.prompt}
-Assistant:"""
-        else:
-            # No context found - still include system prompt
-            full_prompt = f"""{SYSTEM_PROMPT}
-
-User: {request.prompt}
-Assistant:"""
-
-        ollama_response = requests.post(
-            f"{OLLAMA_BASE_URL}/api/generate",
-            json={
-                "model": MODEL_NAME,
-                "prompt": full_prompt,
-                "stream": False,
-            },
-            timeout=120,
+
+CONTEXT_HEADER = "Relevant facts from knowledge base:"
+# Room for the chat template's role markers around system prompt and turn
+TEMPLATE_OVERHEAD_TOKENS = 16
+# A lowest-ranked fact is cut to fit if at least this much room is left,
+# otherwise it is dropped
+MIN_FACT_TOKENS = 16
+
+
+def build_prompt(prompt: str, facts: list, history: list = (), budget: int = PROMPT_TOKEN_BUDGET):
+    """Assemble the per-request part of the prompt within a token budget.
+
+    SYSTEM_PROMPT is not included here; it goes in Ollama's `system` field
+    (see ollama_payload) so it forms an identical prefix on every request,
+    but it counts against the budget. Session history comes next since it
+    only grows between turns, then the facts for this question, then the
+    question itself.
+
+    The question always goes in; if it alone is over budget its start is
+    cut. History blocks (see SessionStore.history), already bounded by the
+    session store, are kept next, whole turns dropped oldest first if
+    needed, the summary of earlier turns before any of them. Facts fill
+    what is left in rank order, so the lowest-ranked are truncated or
+    dropped first.
+
+    Returns (full_prompt, prompt_tokens, facts_used).
+    """
+    used = TEMPLATE_OVERHEAD_TOKENS + SYSTEM_PROMPT_TOKENS
+    question = f"User: {prompt}\nAssistant:"
+    question_tokens = estimate_tokens(question)
+    if used + question_tokens > budget:
+        room = max(budget - used - estimate_tokens("User: \nAssistant:"), 0)
+        question = f"User: {truncate_tokens(prompt, room, from_end=True)}\nAssistant:"
+        return question, used + estimate_tokens(question), 0
+    used += question_tokens
+
+    # Sections are joined by a blank line, two newline tokens each
+    history_blocks = []
+    if history:
+        # Blocks are joined by newlines, one token each
+        block_tokens = [estimate_tokens(block) + 1 for block in history]
+        total = sum(block_tokens) + 1
+        start = 0
+        while start < len(history) and used + total > budget:
+            total -= block_tokens[start]
+            start += 1
+        history_blocks = list(history[start:])
+        if history_blocks:
+            used += total
+
+    fact_lines = []
+    header_tokens = estimate_tokens(CONTEXT_HEADER) + 2
+    for fact in facts:
+        # A newline after each line, and the header before the first
+        overhead = 1 + (0 if fact_lines else header_tokens)
+        line = f"- {fact}"
+        line_tokens = estimate_tokens(line)
+        if used + overhead + line_tokens > budget:
+            room = budget - used - overhead
+            if room < MIN_FACT_TOKENS:
+                break
+            line = truncate_tokens(line, room)
+            fact_lines.append(line)
+            used += overhead + estimate_tokens(line)
+            break
+        fact_lines.append(line)
+        used += overhead + line_tokens
+
+    sections = []
+    if history_blocks:
+        sections.append("\n".join(history_blocks))
+    if fact_lines:
+        sections.append(CONTEXT_HEADER + "\n" + "\n".join(fact_lines))
+    sections.append(question)
+    return "\n\n".join(sections), used, len(fact_lines)
+
+
+def ollama_payload(full_prompt: str, stream: bool) -> dict:
+    """Request body for /api/generate.
+
+    The static system prompt is sent separately so the model template puts
+    it first, byte-for-byte the same each time. The backend's prompt cache
+    can then reuse the KV entries for that prefix and only prefill the
+    facts and question.
+    """
+    return {
+        "model": MODEL_NAME,
+        "system": SYSTEM_PROMPT,
+        "prompt": full_prompt,
+        "stream": stream,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        # Pin the window build_prompt budgets for, and cap the answer to the
+        # reserve so prompt plus answer always fit
+        "options": {
+            "num_ctx": OLLAMA_NUM_CTX,
+            "num_predict": GENERATION_RESERVE_TOKENS,
+        },
+    }
+
+
+def is_short_prompt(prompt: str) -> bool:
+    return estimate_tokens(prompt) <= SCHEDULER_SHORT_PROMPT_TOKENS
+
+
+def admission_error(e: Exception) -> HTTPException:
+    """429 when the queue is full, 503 when a queued request timed out."""
+    if isinstance(e, QueueFullError):
+        return HTTPException(
+            status_code=429,
+            detail=f"Server busy: {e}",
+            headers={"Retry-After": "1"},
         )
+    return HTTPException(status_code=503, detail=f"Server busy: {e}")
+
+
+def record_timings(endpoint: str, spans: Spans, result: dict = None, cached: bool = False) -> dict:
+    """Export a finished request's stage spans and Ollama counters as metrics.
+
+    Returns the same numbers, durations in milliseconds, for the optional
+    `timings` block of the response.
+    """
+    total = spans.total()
+    REQUEST_SECONDS.observe(total, endpoint=endpoint, cached=str(cached).lower())
+    timings = {}
+    for stage, seconds in spans.durations.items():
+        STAGE_SECONDS.observe(seconds, endpoint=endpoint, stage=stage)
+        timings[f"{stage}_ms"] = round(seconds * 1000, 2)
+    timings["total_ms"] = round(total * 1000, 2)
+
+    if result:
+        # Ollama reports durations in nanoseconds
+        for field, histogram, scale in (
+            ("prompt_eval_duration", OLLAMA_PROMPT_EVAL_SECONDS, 1e-9),
+            ("eval_duration", OLLAMA_EVAL_SECONDS, 1e-9),
+            ("prompt_eval_count", OLLAMA_PROMPT_EVAL_TOKENS, 1),
+            ("eval_count", OLLAMA_EVAL_TOKENS, 1),
+        ):
+            value = result.get(field)
+            if value is not None:
+                histogram.observe(value * scale)
+                timings[field.replace("_duration", "_ms")] = (
+                    round(value / 1e6, 2) if scale != 1 else value
+                )
+    return timings
+
+
+async def generate_completion(full_prompt: str, short: bool, spans: Spans) -> dict:
+    """Run one non-streaming generation in a scheduler slot.
 
+    Time waiting for the slot and in Ollama is added to `spans` as the
+    "queue" and "llm" stages. Returns Ollama's final message, or raises
+    HTTPException if the backend answered with an error.
+    """
+    async with scheduler.slot(short) as waited:
+        spans.add("queue", waited)
+        with spans.span("llm"):
+            backend, ollama_response = await ollama_backends.send(
+                "POST", "/api/generate", json=ollama_payload(full_prompt, stream=False)
+            )
+            result = None
+            try:
+                await ollama_response.aread()
+                if ollama_response.status_code == 200:
+                    result = ollama_response.json()
+            finally:
+                ollama_backends.finish(backend, result)
+
+    if result is None:
+        raise HTTPException(status_code=500, detail="Ollama API error")
+    return result
+
+
+async def lookup_context(prompt: str) -> list:
+    """query_knowledge_graph() off the event loop, shared by identical prompts in flight."""
+    # FalkorDB client is synchronous - keep it off the event loop
+    if not REQUEST_COALESCING:
+        return await asyncio.to_thread(query_knowledge_graph, prompt)
+    facts, _joined = await lookup_flights.run(
+        normalize_prompt(prompt), lambda: asyncio.to_thread(query_knowledge_graph, prompt)
+    )
+    return facts
+
+
+def flight_key(prompt: str, facts: list, history: list, short: bool, stream: bool):
+    """Requests with the same key can share one generation.
+
+    The key is the normalized question plus everything assembled around it
+    (facts and history), and the priority it queues at. Returns None when
+    coalescing is off.
+    """
+    if not REQUEST_COALESCING:
+        return None
+    return (normalize_prompt(prompt), tuple(facts), tuple(history), short, stream)
+
+
+async def coalesced_completion(endpoint: str, key, full_prompt: str, short: bool, spans: Spans):
+    """generate_completion(), shared with identical requests already in flight.
+
+    Returns (result, joined). A request that joined another's generation
+    records its wait as the "coalesced" stage rather than queue and llm.
+    """
+    if key is None:
+        return await generate_completion(full_prompt, short, spans), False
+    started = time.perf_counter()
+    result, joined = await flights.run(key, lambda: generate_completion(full_prompt, short, spans))
+    if joined:
+        spans.add("coalesced", time.perf_counter() - started)
+        COALESCED_REQUESTS.inc(endpoint=endpoint)
+    return result, joined
+
+
+async def ollama_stream(full_prompt: str, short: bool):
+    """Admit and run one streaming generation.
+
+    Yields None once Ollama has accepted the request, then each parsed
+    chunk through the final "done" one. Admission and backend failures
+    before that are raised as HTTPException. The scheduler slot is held
+    until the generator finishes or is closed.
+    """
+    try:
+        await scheduler.acquire(short)
+    except (QueueFullError, QueueTimeoutError) as e:
+        raise admission_error(e)
+    try:
+        backend, ollama_response = await ollama_backends.send(
+            "POST",
+            "/api/generate",
+            json=ollama_payload(full_prompt, stream=True),
+            stream=True,
+        )
+    except FAILOVER_ERRORS:
+        scheduler.release()
+        raise HTTPException(
+            status_code=503,
+            detail="Ollama is not running. Start it with 'ollama serve'",
+        )
+    except BaseException:
+        scheduler.release()
+        raise
+
+    final = None
+    try:
         if ollama_response.status_code != 200:
             raise HTTPException(status_code=500, detail="Ollama API error")
+        yield None
+        async for line in ollama_response.aiter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get("done"):
+                # Set before yielding: the reader may close us at the last chunk
+                final = chunk
+            yield chunk
+            if final is not None:
+                break
+    finally:
+        try:
+            # Shielded: a cancellation mid-close would leave the connection
+            # checked out of the pool for good
+            await asyncio.shield(ollama_response.aclose())
+        finally:
+            ollama_backends.finish(backend, final)
+            scheduler.release()
+
 
-        result = ollama_response.json()
+@app.post("/generate", response_model=GenerateResponse)
+async def generate(request: GenerateRequest):
+    spans = Spans()
+    history = sessions.history(request.session_id) if request.session_id else []
+    # Answers that depend on earlier turns can't be shared across users
+    use_response_cache = RESPONSE_CACHE_ENABLED and not history
 
+    if use_response_cache:
+        # May be a round trip to the shared store
+        cached = await asyncio.to_thread(response_cache.get, request.prompt)
+        if cached is not None:
+            response, context_used = cached
+            if request.session_id:
+                sessions.append(request.session_id, request.prompt, response)
+            timings = record_timings("generate", spans, cached=True)
+            return GenerateResponse(
+                response=response,
+                context_used=context_used,
+                cached=True,
+                session_id=request.session_id,
+                timings=timings if request.timings else None,
+            )
+
+    try:
+        with spans.span("retrieval"):
+            facts = await lookup_context(request.prompt)
+
+        # Build prompt with history and facts, trimmed to the token budget
+        with spans.span("prompt"):
+            full_prompt, prompt_tokens, facts_used = build_prompt(
+                request.prompt, facts, history
+            )
+
+        short = is_short_prompt(request.prompt)
+        key = flight_key(request.prompt, facts, history, short, False)
+        result, joined = await coalesced_completion("generate", key, full_prompt, short, spans)
+        response = result.get("response", "").strip()
+
+        # The request that ran the generation caches it and reports Ollama's counters
+        if use_response_cache and response and not joined:
+            await asyncio.to_thread(response_cache.set, request.prompt, (response, facts_used > 0))
+        if request.session_id and response:
+            sessions.append(request.session_id, request.prompt, response)
+
+        timings = record_timings("generate", spans, None if joined else result)
         return GenerateResponse(
-            response=result.get("response", "").strip(), context_used=bool(context)
+            response=response,
+            context_used=facts_used > 0,
+            session_id=request.session_id,
+            prompt_tokens=prompt_tokens,
+            timings=timings if request.timings else None,
         )
 
-    except requests.exceptions.ConnectionError:
+    except HTTPException:
+        raise
+    except (QueueFullError, QueueTimeoutError) as e:
+        raise admission_error(e)
+    except FAILOVER_ERRORS:
         raise HTTPException(
             status_code=503,
             detail="Ollama is not running. Start it with 'ollama serve'",
@@ -1169,7 +1141,223 @@ Assistant:"""
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/generate/stream")
+async def generate_stream(request: GenerateRequest):
+    """Stream the completion as NDJSON, one line per token chunk.
+
+    Each line is {"response": "...", "done": false}; the last line has
+    "done": true plus context_used, cached, prompt_tokens and, if asked
+    for, timings. Errors after the stream has started are reported as a
+    final {"error": "...", "done": true} line.
+    """
+    spans = Spans()
+    history = sessions.history(request.session_id) if request.session_id else []
+    use_response_cache = RESPONSE_CACHE_ENABLED and not history
+
+    if use_response_cache:
+        # May be a round trip to the shared store
+        cached = await asyncio.to_thread(response_cache.get, request.prompt)
+        if cached is not None:
+            response, context_used = cached
+            if request.session_id:
+                sessions.append(request.session_id, request.prompt, response)
+            final_line = {"done": True, "context_used": context_used, "cached": True}
+            timings = record_timings("stream", spans, cached=True)
+            if request.timings:
+                final_line["timings"] = timings
+            lines = [
+                json.dumps({"response": response, "done": False}) + "\n",
+                json.dumps(final_line) + "\n",
+            ]
+            return StreamingResponse(iter(lines), media_type="application/x-ndjson")
+
+    with spans.span("retrieval"):
+        facts = await lookup_context(request.prompt)
+    with spans.span("prompt"):
+        full_prompt, prompt_tokens, facts_used = build_prompt(
+            request.prompt, facts, history
+        )
+
+    short = is_short_prompt(request.prompt)
+    key = flight_key(request.prompt, facts, history, short, True)
+    if key is None:
+        chunks, joined = ollama_stream(full_prompt, short), False
+    else:
+        chunks, joined = flights.subscribe(
+            key, lambda: ollama_stream(full_prompt, short), last=lambda chunk: chunk and chunk.get("done")
+        )
+        if joined:
+            COALESCED_REQUESTS.inc(endpoint="stream")
+
+    # Wait for Ollama to accept the generation, so admission and backend
+    # errors are still returned as HTTP errors
+    try:
+        with spans.span("queue"):
+            await chunks.__anext__()
+    except BaseException:
+        await chunks.aclose()
+        raise
+    llm_started = time.perf_counter()
+
+    async def stream_chunks():
+        parts = []
+        final = None
+        try:
+            async for chunk in chunks:
+                if chunk.get("error"):
+                    # Ollama reports failures mid-stream as {"error": ...}
+                    raise RuntimeError(chunk["error"])
+                if chunk.get("done"):
+                    final = chunk
+                    break
+                if not parts:
+                    TIME_TO_FIRST_TOKEN_SECONDS.observe(spans.total())
+                parts.append(chunk.get("response", ""))
+                yield json.dumps({"response": parts[-1], "done": False}) + "\n"
+            spans.add("llm", time.perf_counter() - llm_started)
+
+            response = "".join(parts).strip()
+            if use_response_cache and response and not joined:
+                await asyncio.to_thread(
+                    response_cache.set, request.prompt, (response, facts_used > 0)
+                )
+            if request.session_id and response:
+                sessions.append(request.session_id, request.prompt, response)
+            final_line = {
+                "done": True,
+                "context_used": facts_used > 0,
+                "cached": False,
+                "prompt_tokens": prompt_tokens,
+            }
+            timings = record_timings("stream", spans, None if joined else final)
+            if request.timings:
+                final_line["timings"] = timings
+            yield json.dumps(final_line) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": str(e), "done": True}) + "\n"
+        finally:
+            # Stops the generation, unless identical requests still read it
+            await chunks.aclose()
+
+    return StreamingResponse(stream_chunks(), media_type="application/x-ndjson")
+
+
+@app.post("/generate/batch")
+async def generate_batch(request: BatchRequest):
+    """Answer many prompts in one request, streamed as NDJSON as each finishes.
+
+    The knowledge-base lookups for the whole batch are done up front in one
+    graph query, then BATCH_CONCURRENCY generations run at a time. Each line
+    is {"index": i, "response": ..., "context_used": ..., "cached": ...,
+    "prompt_tokens": ...} or {"index": i, "error": ...}, in completion order;
+    the last line is {"done": true, "count": n, "errors": k}. Batch prompts
+    are stateless, without session history.
+    """
+    prompts = request.prompts
+    if len(prompts) > BATCH_MAX_PROMPTS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch of {len(prompts)} prompts exceeds the limit of {BATCH_MAX_PROMPTS}",
+        )
+
+    results = asyncio.Queue()
+    pending = []
+    if RESPONSE_CACHE_ENABLED:
+        all_cached = await asyncio.to_thread(
+            lambda: [response_cache.get(prompt) for prompt in prompts]
+        )
+    else:
+        all_cached = [None] * len(prompts)
+    for index, cached in enumerate(all_cached):
+        if cached is not None:
+            response, context_used = cached
+            results.put_nowait(
+                {"index": index, "response": response, "context_used": context_used, "cached": True}
+            )
+        else:
+            pending.append(index)
+
+    started = time.perf_counter()
+    all_facts = await asyncio.to_thread(
+        query_knowledge_graph_batch, [prompts[index] for index in pending]
+    )
+    STAGE_SECONDS.observe(time.perf_counter() - started, endpoint="batch", stage="retrieval")
+    work = asyncio.Queue()
+    for index, facts in zip(pending, all_facts):
+        work.put_nowait((index, facts))
+
+    async def worker():
+        while not work.empty():
+            index, facts = work.get_nowait()
+            prompt = prompts[index]
+            spans = Spans()
+            try:
+                with spans.span("prompt"):
+                    full_prompt, prompt_tokens, facts_used = build_prompt(prompt, facts)
+                key = flight_key(prompt, facts, (), False, False)
+                result, joined = await coalesced_completion("batch", key, full_prompt, False, spans)
+                record_timings("batch", spans, None if joined else result)
+                response = result.get("response", "").strip()
+                if RESPONSE_CACHE_ENABLED and response and not joined:
+                    await asyncio.to_thread(response_cache.set, prompt, (response, facts_used > 0))
+                line = {
+                    "index": index,
+                    "response": response,
+                    "context_used": facts_used > 0,
+                    "cached": False,
+                    "prompt_tokens": prompt_tokens,
+                }
+            except HTTPException as e:
+                line = {"index": index, "error": e.detail}
+            except (QueueFullError, QueueTimeoutError) as e:
+                line = {"index": index, "error": f"Server busy: {e}"}
+            except FAILOVER_ERRORS:
+                line = {"index": index, "error": "Ollama is not running"}
+            except Exception as e:
+                line = {"index": index, "error": str(e)}
+            results.put_nowait(line)
+
+    async def stream_results():
+        workers = [asyncio.create_task(worker()) for _ in range(min(BATCH_CONCURRENCY, len(pending)))]
+        errors = 0
+        try:
+            for _ in range(len(prompts)):
+                line = await results.get()
+                errors += "error" in line
+                yield json.dumps(line) + "\n"
+            yield json.dumps({"done": True, "count": len(prompts), "errors": errors}) + "\n"
+        finally:
+            # Client went away or the batch is done - stop outstanding generations
+            for task in workers:
+                task.cancel()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
 if __name__ == "__main__":
-    import uvicorn
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local LLM chatbot server")
+    subcommands = parser.add_subparsers(dest="command")
+    load_kb = subcommands.add_parser(
+        "load-kb", help="sync the knowledge graph from KB_PATH and exit"
+    )
+    load_kb.add_argument(
+        "--force", action="store_true", help="reload even if the graph is up to date"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("WEB_CONCURRENCY", "1")),
+        help="server processes sharing the port (see Multiple Workers in the README)",
+    )
+    args = parser.parse_args()
+
+    if args.command == "load-kb":
+        setup_knowledge_graph(force=args.force)
+    else:
+        import uvicorn
 
-    uvicorn.run(app, host="0.0.0.0", port=5005)
+        # Extra workers each import the app themselves, so it goes by name
+        target = app if args.workers == 1 else "server:app"
+        uvicorn.run(target, host="0.0.0.0", port=5005, workers=args.workers)
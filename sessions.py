@@ -0,0 +1,137 @@
+from collections import OrderedDict, deque
+import re
+import threading
+import time
+
+from retrieval import estimate_tokens, truncate_tokens
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def _first_sentence(text: str, max_words: int) -> str:
+    sentence = _SENTENCE_END.split(text.strip(), maxsplit=1)[0]
+    words = sentence.split()
+    if len(words) > max_words:
+        return " ".join(words[:max_words]) + "..."
+    return sentence
+
+
+def summarize_turn(user: str, assistant: str) -> str:
+    """One-line extractive summary of a turn; cheap enough to run inline."""
+    return f"User asked: {_first_sentence(user, 16)} Assistant: {_first_sentence(assistant, 24)}"
+
+
+class Session:
+    def __init__(self):
+        self.turns = deque()  # (user, assistant, tokens)
+        self.turn_tokens = 0
+        self.summary = deque()  # (line, tokens)
+        self.summary_tokens = 0
+        self.last_used = time.monotonic()
+
+
+class SessionStore:
+    """Server-side conversation history, bounded per session and in total.
+
+    Each session keeps its most recent turns verbatim up to
+    `history_tokens`. Older turns are compacted into one-line summaries,
+    themselves capped at `summary_tokens` (oldest dropped first). Sessions
+    idle for `ttl` seconds are dropped, and past `max_sessions` the least
+    recently used go first, so memory stays flat however many clients
+    connect.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 10000,
+        ttl: float = 1800.0,
+        history_tokens: int = 512,
+        summary_tokens: int = 128,
+    ):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def _expire(self, now: float):
+        # Access order is LRU order, so idle sessions sit at the front
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_used < self.ttl:
+                break
+            del self._sessions[session_id]
+            self.expirations += 1
+
+    def history(self, session_id: str) -> list:
+        """Conversation so far for the prompt, as blocks oldest first.
+
+        The summary of earlier turns, if any, is one block and each recent
+        turn another, so the prompt can drop whole turns. Empty for a new
+        session.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                return []
+            session.last_used = now
+            self._sessions.move_to_end(session_id)
+
+            blocks = []
+            if session.summary:
+                lines = ["Summary of earlier conversation:"]
+                lines.extend(f"- {line}" for line, _tokens in session.summary)
+                blocks.append("\n".join(lines))
+            for user, assistant, _tokens in session.turns:
+                blocks.append(f"User: {user}\nAssistant: {assistant}")
+            return blocks
+
+    def append(self, session_id: str, user: str, assistant: str):
+        """Record a finished turn, compacting old turns to stay in budget."""
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = Session()
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evictions += 1
+            session.last_used = now
+            self._sessions.move_to_end(session_id)
+
+            # A single huge turn is clipped to the budget, so no session can
+            # outgrow it: the question to half, the answer to what is left
+            user = truncate_tokens(user, self.history_tokens // 2)
+            assistant = truncate_tokens(assistant, self.history_tokens - estimate_tokens(user))
+            tokens = estimate_tokens(user) + estimate_tokens(assistant)
+            session.turns.append((user, assistant, tokens))
+            session.turn_tokens += tokens
+
+            while session.turn_tokens > self.history_tokens and len(session.turns) > 1:
+                old_user, old_assistant, old_tokens = session.turns.popleft()
+                session.turn_tokens -= old_tokens
+                line = summarize_turn(old_user, old_assistant)
+                line_tokens = estimate_tokens(line)
+                session.summary.append((line, line_tokens))
+                session.summary_tokens += line_tokens
+                while session.summary_tokens > self.summary_tokens and session.summary:
+                    _line, dropped = session.summary.popleft()
+                    session.summary_tokens -= dropped
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def stats(self) -> dict:
+        return {
+            "active": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "ttl": self.ttl,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,43 @@
+import time
+
+from retrieval import Neighborhood
+
+
+class GraphSnapshot:
+    """Read-only, in-process copy of the knowledge graph at one version.
+
+    Topics are held as parallel lists (ids, categories, facts) with an
+    id -> row dict, and RELATED edges as the CSR adjacency of a Neighborhood
+    sharing that dict, so serving a request's facts and neighbors never
+    leaves the process. FalkorDB stays the source of truth: the snapshot is
+    replaced, never mutated, whenever the graph's version counter moves.
+    """
+
+    def __init__(self, topics: dict, edges, version=None):
+        self.version = version
+        self.loaded_at = time.time()
+        self.ids = list(topics)
+        self.index = {tid: row for row, tid in enumerate(self.ids)}
+        self.categories = [topics[tid][0] for tid in self.ids]
+        self.facts = [topics[tid][1] for tid in self.ids]
+        self.neighborhood = Neighborhood(topics, edges, index=self.index)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def fetch_facts(self, topic_ids: list) -> dict:
+        """The facts for topic_ids as id -> fact, like the TOPICS_BY_ID query."""
+        found = {}
+        for tid in topic_ids:
+            row = self.index.get(tid)
+            if row is not None and self.facts[row]:
+                found[tid] = self.facts[row]
+        return found
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "topics": len(self.ids),
+            "edges": len(self.neighborhood) // 2,
+            "age_s": round(time.time() - self.loaded_at, 1),
+        }
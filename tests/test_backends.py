@@ -0,0 +1,85 @@
+import asyncio
+
+import httpx
+import pytest
+
+from backends import BackendPool
+
+
+def make_pool(handlers: dict) -> tuple:
+    """A pool whose backends answer through `handlers` (url -> handler); returns (pool, calls)."""
+    pool = BackendPool(list(handlers), timeout=httpx.Timeout(1.0))
+    calls = []
+    for backend in pool.backends:
+        handler = handlers[backend.url]
+
+        def transport(request, url=backend.url, handler=handler):
+            calls.append(url)
+            return handler(request)
+
+        backend.client = httpx.AsyncClient(base_url=backend.url, transport=httpx.MockTransport(transport))
+    return pool, calls
+
+
+def ok(request):
+    return httpx.Response(200, json={"done": True})
+
+
+def refuse(request):
+    raise httpx.ConnectError("connection refused", request=request)
+
+
+def test_requires_a_backend():
+    with pytest.raises(ValueError):
+        BackendPool([], timeout=httpx.Timeout(1.0))
+
+
+def test_candidates_order_by_expected_wait():
+    pool, _calls = make_pool({"http://a": ok, "http://b": ok, "http://c": ok})
+    a, b, c = pool.backends
+    a.tokens_per_sec, b.tokens_per_sec, c.tokens_per_sec = 10.0, 40.0, 20.0
+    a.in_flight, b.in_flight, c.in_flight = 0, 3, 0
+    # Expected waits: a 1/10, b 4/40, c 1/20
+    assert [x.url for x in pool.candidates()][0] == "http://c"
+    assert set(x.url for x in pool.candidates()[1:]) == {"http://a", "http://b"}
+
+
+def test_fails_over_to_the_next_backend():
+    async def main():
+        pool, calls = make_pool({"http://a": refuse, "http://b": ok})
+        a, b = pool.backends
+        a.tokens_per_sec, b.tokens_per_sec = 100.0, 10.0  # a is tried first
+        backend, response = await pool.send("POST", "/api/generate", json={})
+        pool.finish(backend, response.json())
+        assert calls == ["http://a", "http://b"]
+        assert backend is b and response.status_code == 200
+        assert not a.healthy and a.failures == 1 and a.in_flight == 0
+        assert b.in_flight == 0 and b.requests == 1
+
+    asyncio.run(main())
+
+
+def test_unhealthy_backend_is_skipped():
+    async def main():
+        pool, calls = make_pool({"http://a": ok, "http://b": ok})
+        a, b = pool.backends
+        a.tokens_per_sec, b.tokens_per_sec = 100.0, 10.0
+        pool.mark_down(a, httpx.ConnectError("refused"))
+        assert pool.candidates() == [b, a]
+        backend, _response = await pool.send("POST", "/api/generate", json={})
+        pool.finish(backend)
+        assert backend is b
+        assert calls == ["http://b"]
+
+    asyncio.run(main())
+
+
+def test_raises_the_last_error_when_every_backend_fails():
+    async def main():
+        pool, calls = make_pool({"http://a": refuse, "http://b": refuse})
+        with pytest.raises(httpx.ConnectError):
+            await pool.send("POST", "/api/generate", json={})
+        assert sorted(calls) == ["http://a", "http://b"]
+        assert all(not backend.healthy and backend.in_flight == 0 for backend in pool.backends)
+
+    asyncio.run(main())
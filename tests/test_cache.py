@@ -0,0 +1,54 @@
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from benchmarks.stubs import MemoryRedis
+from cache import LRUCache, SharedCache
+
+
+def make_cache(store, version=None):
+    return SharedCache(LRUCache(maxsize=16, ttl=60), lambda: store, "test:context", version=version)
+
+
+def test_entries_are_shared_between_workers():
+    store = MemoryRedis()
+    first, second = make_cache(store), make_cache(store)
+    first.set(("what is python", 3), ["Python is a language."])
+    assert second.get(("what is python", 3)) == ["Python is a language."]
+    assert second.shared_hits == 1
+    # Copied into the local cache, so the next lookup stays in process
+    assert second.get(("what is python", 3)) == ["Python is a language."]
+    assert second.shared_hits == 1
+
+
+def test_entries_from_another_graph_version_are_not_read():
+    store = MemoryRedis()
+    versions = {"old": 1, "new": 2}
+    stale = make_cache(store, version=lambda: versions["old"])
+    fresh = make_cache(store, version=lambda: versions["new"])
+    stale.set("mars", ["Mars is red."])
+    assert fresh.get("mars") is None
+    fresh.set("mars", ["Mars is the fourth planet."])
+    assert make_cache(store, version=lambda: 2).get("mars") == ["Mars is the fourth planet."]
+
+
+def test_clear_drops_shared_entries():
+    store = MemoryRedis()
+    cache = make_cache(store, version=lambda: 1)
+    cache.set("mars", ["Mars is red."])
+    cache.clear()
+    assert store.data == {}
+    assert cache.get("mars") is None
+
+
+def test_store_errors_count_as_misses():
+    class DownRedis:
+        def get(self, key):
+            raise RedisConnectionError("down")
+
+        def set(self, key, value, px=None):
+            raise RedisConnectionError("down")
+
+    cache = make_cache(DownRedis())
+    cache.set("mars", ["Mars is red."])
+    assert cache.get("mars") == ["Mars is red."]  # still cached locally
+    assert cache.get("venus") is None
+    assert cache.shared_errors == 2
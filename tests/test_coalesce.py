@@ -0,0 +1,251 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+import pytest
+import uvicorn
+from fastapi.testclient import TestClient
+
+import server
+from benchmarks.stubs import MemoryGraph, stub_ollama_app
+from coalesce import SingleFlight
+from knowledge_base import read_knowledge_base
+
+
+def test_run_shares_one_call():
+    async def main():
+        flights = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        results = await asyncio.gather(*(flights.run("k", work) for _ in range(5)))
+        assert [result for result, _joined in results] == ["answer"] * 5
+        assert sum(joined for _result, joined in results) == 4
+        assert len(calls) == 1 and len(flights) == 0
+
+    asyncio.run(main())
+
+
+def test_subscribers_replay_the_whole_stream():
+    async def main():
+        flights = SingleFlight()
+
+        async def numbers():
+            for i in range(3):
+                await asyncio.sleep(0.01)
+                yield i
+
+        async def read():
+            items, _joined = flights.subscribe("k", numbers)
+            return [item async for item in items]
+
+        first = asyncio.ensure_future(read())
+        await asyncio.sleep(0.025)  # join after two items are out
+        assert await read() == [0, 1, 2]
+        assert await first == [0, 1, 2]
+        await asyncio.sleep(0)  # the flight is forgotten once its task ends
+        assert len(flights) == 0
+
+    asyncio.run(main())
+
+
+def test_settled_stream_finishes_its_cleanup():
+    async def main():
+        flights = SingleFlight()
+        cleaned = asyncio.Event()
+
+        async def chunks():
+            try:
+                yield "token"
+                yield "done"
+            finally:
+                await asyncio.sleep(0.01)
+                cleaned.set()
+
+        items, _joined = flights.subscribe("k", chunks, last=lambda item: item == "done")
+        async for item in items:
+            if item == "done":
+                break
+        await items.aclose()
+        # The last reader left at the final item: cleanup still runs to the end
+        await asyncio.wait_for(cleaned.wait(), 1)
+
+    asyncio.run(main())
+
+
+def test_unsettled_stream_is_cancelled_when_every_reader_leaves():
+    async def main():
+        flights = SingleFlight()
+        closed = asyncio.Event()
+
+        async def chunks():
+            try:
+                yield "token"
+                await asyncio.sleep(10)
+                yield "done"
+            finally:
+                closed.set()
+
+        items, _joined = flights.subscribe("k", chunks, last=lambda item: item == "done")
+        assert await items.__anext__() == "token"
+        await items.aclose()
+        await asyncio.wait_for(closed.wait(), 1)
+        await asyncio.sleep(0)
+        assert len(flights) == 0
+
+    asyncio.run(main())
+
+
+def test_subscriber_does_not_join_a_stream_being_cancelled():
+    async def main():
+        flights = SingleFlight()
+        cleaning = asyncio.Event()
+
+        async def chunks():
+            try:
+                yield "token"
+                await asyncio.sleep(10)
+                yield "done"
+            finally:
+                cleaning.set()
+                await asyncio.sleep(0.05)
+
+        items, _joined = flights.subscribe("k", chunks, last=lambda item: item == "done")
+        assert await items.__anext__() == "token"
+        await items.aclose()
+        await asyncio.wait_for(cleaning.wait(), 1)
+        assert len(flights) == 1  # still listed while its cleanup runs
+
+        async def quick():
+            yield "token"
+            yield "done"
+
+        items, joined = flights.subscribe("k", quick, last=lambda item: item == "done")
+        assert not joined
+        assert [item async for item in items] == ["token", "done"]
+
+    asyncio.run(main())
+
+
+def test_caller_does_not_join_a_call_being_cancelled():
+    async def main():
+        flights = SingleFlight()
+        cleaning = asyncio.Event()
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            finally:
+                cleaning.set()
+                await asyncio.sleep(0.05)
+
+        async def quick():
+            return "answer"
+
+        first = asyncio.ensure_future(flights.run("k", slow))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.wait_for(cleaning.wait(), 1)
+        assert await flights.run("k", quick) == ("answer", False)
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    asyncio.run(main())
+
+
+def test_stream_cut_short_raises_instead_of_ending():
+    async def main():
+        flights = SingleFlight()
+
+        async def truncated():
+            yield "token"
+
+        items, _joined = flights.subscribe("k", truncated, last=lambda item: item == "done")
+        assert await items.__anext__() == "token"
+        with pytest.raises(RuntimeError, match="before its last item"):
+            await items.__anext__()
+
+    asyncio.run(main())
+
+
+@pytest.fixture(scope="module")
+def stub_ollama():
+    """The benchmark stub Ollama on a real socket, for the whole module."""
+    config = uvicorn.Config(
+        stub_ollama_app(token_rate=2000, prefill=0.005, tokens=8, parallel=64),
+        host="127.0.0.1",
+        port=0,
+        log_level="warning",
+    )
+    stub = uvicorn.Server(config)
+    thread = threading.Thread(target=stub.run, daemon=True)
+    thread.start()
+    while not stub.started:
+        time.sleep(0.01)
+    port = stub.servers[0].sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}"
+    stub.should_exit = True
+    thread.join()
+
+
+@pytest.fixture
+def client(stub_ollama, monkeypatch):
+    topics, edges = read_knowledge_base(server.KB_PATH)
+    graph = MemoryGraph(topics, edges)
+    monkeypatch.setattr(server, "_graph", graph)
+    monkeypatch.setattr(server, "_bulk_graph", graph)
+    monkeypatch.setattr(server, "KB_LOAD_ON_STARTUP", False)
+    monkeypatch.setattr(server, "GRAPH_SNAPSHOT_REFRESH_INTERVAL", 0)
+    monkeypatch.setattr(server, "OLLAMA_BASE_URLS", [stub_ollama])
+    monkeypatch.setattr(server, "REQUEST_COALESCING", True)
+    monkeypatch.setattr(server, "RESPONSE_CACHE_ENABLED", False)
+    # A leaked connection then fails the test within seconds instead of hanging
+    monkeypatch.setattr(server, "OLLAMA_MAX_CONNECTIONS", 4)
+    monkeypatch.setattr(server, "OLLAMA_TIMEOUT", 5.0)
+    with TestClient(server.app) as test_client:
+        yield test_client
+
+
+def stream(client, prompt: str) -> list:
+    with client.stream("POST", "/generate/stream", json={"prompt": prompt}) as response:
+        assert response.status_code == 200
+        return [line for line in response.iter_lines() if line]
+
+
+def assert_drained():
+    """Every Ollama connection, scheduler slot and flight is given back."""
+    pool = server.ollama_backends.backends[0].client._transport._pool
+    deadline = time.monotonic() + 2
+    while time.monotonic() < deadline:
+        busy = [connection for connection in pool.connections if not connection.is_idle()]
+        if not busy and server.scheduler.in_flight == 0 and not len(server.flights):
+            return
+        time.sleep(0.01)
+    raise AssertionError(
+        f"not drained: {len(busy)} busy connections, "
+        f"{server.scheduler.in_flight} in flight, {len(server.flights)} flights"
+    )
+
+
+def test_sequential_coalesced_streams_release_connections(client):
+    for _ in range(12):
+        lines = stream(client, "what is python")
+        assert '"done": true' in lines[-1] and "error" not in lines[-1]
+    assert_drained()
+
+
+def test_concurrent_coalesced_streams_release_connections(client):
+    prompts = ["what is python", "what is python", "tell me about mars", "what is python"] * 6
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda prompt: stream(client, prompt), prompts))
+    for lines in results:
+        assert '"done": true' in lines[-1] and "error" not in lines[-1]
+    assert_drained()
+    # The server still answers once the burst is over
+    assert "error" not in stream(client, "what is python")[-1]
+    assert_drained()
@@ -0,0 +1,152 @@
+import json
+
+import pytest
+
+import server
+from benchmarks.stubs import MemoryGraph
+from knowledge_base import (
+    KnowledgeBaseError,
+    diff_knowledge_base,
+    iter_records,
+    read_knowledge_base,
+)
+
+HEADER = {"format": "chatbot-kb", "version": 1}
+
+
+def write_kb(path, records, header=HEADER):
+    lines = [json.dumps(header)] + [json.dumps(r) if isinstance(r, dict) else r for r in records]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def topic(tid, fact, category="science"):
+    return {"type": "topic", "id": tid, "category": category, "fact": fact}
+
+
+def edge(source, target, relation="related_to"):
+    return {"type": "edge", "source": source, "target": target, "relation": relation}
+
+
+@pytest.mark.parametrize(
+    "header, message",
+    [
+        ({"format": "something-else", "version": 1}, "not a chatbot-kb file"),
+        ({"format": "chatbot-kb", "version": 2}, "unsupported version 2"),
+        ({}, "not a chatbot-kb file"),
+    ],
+)
+def test_header_is_checked(tmp_path, header, message):
+    path = write_kb(tmp_path / "kb.jsonl", [topic("mars", "Mars is red.")], header=header)
+    with pytest.raises(KnowledgeBaseError, match=message):
+        list(iter_records(path))
+
+
+def test_malformed_lines_report_their_line_number(tmp_path):
+    path = write_kb(tmp_path / "kb.jsonl", [topic("mars", "Mars is red."), "{not json"])
+    with pytest.raises(KnowledgeBaseError, match=r"kb.jsonl:3:"):
+        list(iter_records(path))
+
+    path = write_kb(tmp_path / "kb.jsonl", [{"type": "planet", "id": "mars"}])
+    with pytest.raises(KnowledgeBaseError, match=r"kb.jsonl:2: unknown record type 'planet'"):
+        list(iter_records(path))
+
+
+def test_blank_lines_are_skipped_and_later_topics_win(tmp_path):
+    path = write_kb(
+        tmp_path / "kb.jsonl",
+        [topic("mars", "Mars is red."), "", edge("mars", "earth"), topic("mars", "Mars is the fourth planet.")],
+    )
+    topics, edges = read_knowledge_base(path)
+    assert topics == {"mars": ("science", "Mars is the fourth planet.")}
+    assert edges == {("mars", "earth", "related_to")}
+
+
+def test_diff_finds_added_changed_and_removed_topics():
+    current_topics = {"mars": ("science", "Mars is red."), "pluto": ("science", "Pluto is small.")}
+    current_edges = {("mars", "pluto", "related_to")}
+    topics = {"mars": ("science", "Mars is the fourth planet."), "earth": ("science", "Earth has life.")}
+    edges = {("mars", "earth", "related_to"), ("mars", "venus", "related_to")}
+
+    diff = diff_knowledge_base(current_topics, current_edges, topics, edges)
+    assert diff["added"] == ["earth"]
+    assert diff["changed"] == ["mars"]
+    assert diff["removed"] == ["pluto"]
+    assert diff["edges_added"] == [("mars", "earth", "related_to")]
+    assert diff["edges_removed"] == [("mars", "pluto", "related_to")]
+    # venus is not a topic, so that edge could never exist in the graph
+    assert diff["edges_skipped"] == 1
+
+
+def test_unchanged_knowledge_base_has_an_empty_diff():
+    topics = {"mars": ("science", "Mars is red."), "earth": ("science", "Earth has life.")}
+    edges = {("mars", "earth", "related_to")}
+    diff = diff_knowledge_base(topics, edges, topics, edges)
+    assert not any(diff[k] for k in ("added", "changed", "removed", "edges_added", "edges_removed"))
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    graph = MemoryGraph({}, set())
+    monkeypatch.setattr(server, "_graph", graph)
+    monkeypatch.setattr(server, "_bulk_graph", graph)
+    monkeypatch.setattr(server, "KB_BATCH_SIZE", 2)
+    # A sync rebuilds these; put the module's back afterwards
+    for name in ("graph_snapshot", "keyword_index", "neighborhood", "vector_index"):
+        monkeypatch.setattr(server, name, getattr(server, name))
+    return graph
+
+
+def test_sync_writes_only_the_differences(tmp_path, monkeypatch, graph):
+    path = write_kb(
+        tmp_path / "kb.jsonl",
+        [
+            topic("mars", "Mars is red."),
+            topic("earth", "Earth has life."),
+            topic("pluto", "Pluto is small."),
+            edge("mars", "earth"),
+            edge("pluto", "mars"),
+        ],
+    )
+    monkeypatch.setattr(server, "KB_PATH", path)
+    summary = server.setup_knowledge_graph()
+    assert summary["added"] == 3 and summary["edges_added"] == 2
+    assert graph.topics == read_knowledge_base(path)[0]
+    assert graph.version == 1
+    # An unchanged file is skipped after the hash check
+    assert server.setup_knowledge_graph() is None
+
+    write_kb(
+        tmp_path / "kb.jsonl",
+        [
+            topic("mars", "Mars is the fourth planet."),
+            topic("earth", "Earth has life."),
+            topic("venus", "Venus is hot."),
+            edge("mars", "earth"),
+            edge("venus", "earth"),
+            edge("venus", "ceres"),
+        ],
+    )
+    summary = server.setup_knowledge_graph()
+    assert (summary["added"], summary["changed"], summary["removed"]) == (1, 1, 1)
+    assert summary["edges_skipped"] == 1
+    assert graph.topics == {
+        "mars": ("science", "Mars is the fourth planet."),
+        "earth": ("science", "Earth has life."),
+        "venus": ("science", "Venus is hot."),
+    }
+    # pluto's edge went with it; the dangling venus -> ceres edge was never written
+    assert graph.edges == {("mars", "earth", "related_to"), ("venus", "earth", "related_to")}
+    assert graph.version == 2
+    assert server.graph_snapshot.version == 2
+
+
+def test_a_bad_file_leaves_the_graph_alone(tmp_path, monkeypatch, graph):
+    path = write_kb(tmp_path / "kb.jsonl", [topic("mars", "Mars is red.")])
+    monkeypatch.setattr(server, "KB_PATH", path)
+    server.setup_knowledge_graph()
+
+    write_kb(tmp_path / "kb.jsonl", [topic("earth", "Earth has life."), "{broken"])
+    assert server.setup_knowledge_graph() is None
+    assert graph.topics == {"mars": ("science", "Mars is red.")}
+    assert graph.version == 1
@@ -0,0 +1,41 @@
+from retrieval import estimate_tokens
+from server import build_prompt, SYSTEM_PROMPT_TOKENS, TEMPLATE_OVERHEAD_TOKENS
+
+HISTORY = [
+    "Summary of earlier conversation:\n- User asked: What is Mars? Assistant: A planet.",
+    "User: What is Python?\nAssistant: A programming language used for many things.",
+    "User: Who made it?\nAssistant: Guido van Rossum, in 1991.",
+]
+
+
+def budget_for(history_blocks: list) -> int:
+    """The budget that fits the question and exactly these history blocks."""
+    _prompt, tokens, _facts = build_prompt("And then?", [], history_blocks)
+    return tokens
+
+
+def test_history_is_trimmed_by_whole_turns():
+    for start in range(len(HISTORY) + 1):
+        kept = HISTORY[start:]
+        budget = budget_for(kept)
+        prompt, tokens, _facts = build_prompt("And then?", [], HISTORY, budget=budget)
+        assert tokens <= budget
+        expected = "\n".join(kept) + "\n\n" if kept else ""
+        assert prompt == expected + "User: And then?\nAssistant:"
+
+
+def test_no_orphaned_lines_at_any_budget():
+    question_only = budget_for([])
+    for budget in range(question_only, budget_for(HISTORY) + 1):
+        prompt, tokens, _facts = build_prompt("And then?", [], HISTORY, budget=budget)
+        assert tokens <= budget
+        history = prompt[: -len("User: And then?\nAssistant:")].strip()
+        blocks = [block for block in HISTORY if block in history]
+        assert history == "\n".join(blocks)
+
+
+def test_token_count_matches_the_prompt():
+    prompt, tokens, facts_used = build_prompt("What is Python?", ["Python is a language."], HISTORY)
+    assert facts_used == 1
+    # Counted sections plus the system prompt and template outside the prompt text
+    assert tokens == estimate_tokens(prompt) + SYSTEM_PROMPT_TOKENS + TEMPLATE_OVERHEAD_TOKENS
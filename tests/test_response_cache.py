@@ -0,0 +1,55 @@
+import time
+
+from cache import ResponseCache
+
+
+def test_exact_hit_ignores_case_spacing_and_trailing_punctuation():
+    cache = ResponseCache()
+    cache.set("What is Python?", ("A language.", True))
+    assert cache.get("  what is   python ") == ("A language.", True)
+    assert cache.hits == 1 and cache.similar_hits == 0
+
+
+def test_near_duplicate_hit():
+    cache = ResponseCache(threshold=0.9)
+    cache.set("tell me about the solar system", ("Eight planets.", True))
+    cache.set("what is python", ("A language.", True))
+    assert cache.get("tell me about the solar systems") == ("Eight planets.", True)
+    assert cache.similar_hits == 1
+
+
+def test_operators_and_symbols_keep_prompts_apart():
+    cache = ResponseCache(threshold=0.9)
+    cache.set("what is 5+3", ("8", False))
+    for prompt in ["what is 5-3", "what is 5*3", "what is 5.3", "what is 53"]:
+        assert cache.get(prompt) is None, prompt
+    assert cache.get("What is 5+3?") == ("8", False)
+
+    cache.set("what is C++", ("A language.", False))
+    assert cache.get("what is C#") is None
+
+
+def test_least_recently_used_is_evicted():
+    cache = ResponseCache(maxsize=2)
+    cache.set("what is mars", "red")
+    cache.set("what is venus", "hot")
+    assert cache.get("what is mars") == "red"  # venus is now the oldest
+    cache.set("what is jupiter", "big")
+    assert cache.get("what is venus") is None
+    assert cache.get("what is mars") == "red"
+    assert cache.evictions == 1 and len(cache) == 2
+
+
+def test_entries_expire_after_ttl():
+    cache = ResponseCache(ttl=0.05)
+    cache.set("what is mars", "red")
+    assert cache.get("what is mars") == "red"
+    time.sleep(0.1)
+    assert cache.get("what is mars") is None
+    assert cache.get("what is marss") is None  # nor as a near-duplicate
+
+
+def test_disabled_cache_stores_nothing():
+    cache = ResponseCache(maxsize=0)
+    cache.set("what is mars", "red")
+    assert cache.get("what is mars") is None and len(cache) == 0
@@ -0,0 +1,153 @@
+import threading
+import time
+
+import pytest
+
+from retrieval import (
+    SMALL_TALK_MATCHER,
+    InvertedIndex,
+    RetrievalPipeline,
+    SmallTalkMatcher,
+    reciprocal_rank_fusion,
+    tokenize,
+)
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("It's raining, why?", ["raining"]),
+        ("I'm bored", ["bored"]),
+        ("don't you know the Earth’s moon", ["know", "earth", "moon"]),
+        ("I can't and won't", []),
+        ("The planets and galaxies", ["planet", "galaxy"]),
+        ("Pass the glass", ["pass", "glass"]),
+    ],
+)
+def test_tokenize(text, expected):
+    assert tokenize(text) == expected
+
+
+def test_clitics_never_become_terms():
+    for token in tokenize("it's I'm you're we'll they've he'd don't isn't let's"):
+        assert len(token) > 1
+        assert token not in {"s", "m", "t", "re", "ll", "ve", "d", "don", "isn"}
+
+
+TOPICS = {
+    "whats_up": ("small_talk", "Not much, just here to help. What's on your mind?"),
+    "hows_life": ("small_talk", "Life's good! How's yours?"),
+    "era": ("history", "An era is a long period of time, like the Stone Age."),
+    "gravity": ("physics", "Gravity is the force that pulls masses toward each other."),
+    "python": ("programming", "Python is a programming language known for readable code."),
+    "rain": ("weather", "Rain is water falling from clouds when droplets get heavy."),
+}
+
+
+@pytest.fixture(scope="module")
+def index():
+    return InvertedIndex(TOPICS)
+
+
+def test_search_ranks_the_matching_topic_first(index):
+    assert index.search("Let's talk about Python", k=3)[0][0] == "python"
+    assert index.search("why does it rain?", k=1)[0][0] == "rain"
+
+
+def test_contractions_do_not_match_small_talk(index):
+    assert "whats_up" not in dict(index.search("let's talk about python", k=6))
+    assert index.search("it's raining, why?", k=6) == []
+    assert index.search("I'm bored", k=6) == []
+
+
+def test_search_respects_k_and_unknown_terms(index):
+    assert len(index.search("gravity pulls rain water", k=2)) == 2
+    assert index.search("gravity", k=0) == []
+    assert index.search("xylophone", k=3) == []
+
+
+def test_score_covers_every_requested_topic(index):
+    scores = index.score("python code", ["python", "rain", "missing"])
+    assert scores["python"] > 0
+    assert scores["rain"] == scores["missing"] == 0.0
+
+
+def test_small_talk_matches_whole_words_only():
+    assert "hi" not in SMALL_TALK_MATCHER.match("which of this is right?")
+    assert "hi" in SMALL_TALK_MATCHER.match("Hi there!")
+    assert SMALL_TALK_MATCHER.match("philosophy") == []
+
+
+def test_small_talk_accepts_plurals_of_longer_words():
+    assert SMALL_TALK_MATCHER.match("name the planets") == ["planet"]
+    assert SMALL_TALK_MATCHER.match("all the oceans") == ["ocean"]
+    # Short patterns and phrases stay exact
+    assert SMALL_TALK_MATCHER.match("dnas") == []
+    matcher = SmallTalkMatcher({"box": ["box"], "speed of light": ["light"]})
+    assert matcher.match("boxes at the speeds of light") == []
+
+
+def test_small_talk_ranks_longest_match_first():
+    matcher = SmallTalkMatcher({"hi": ["greeting"], "how are you": ["how_are_you"], "how": ["how"]})
+    assert matcher.match("hi, how are you?") == ["how are you", "hi"]
+    # Same length: earlier in the prompt first
+    assert SMALL_TALK_MATCHER.match("bye, hey") == ["bye", "hey"]
+    assert SMALL_TALK_MATCHER.match("hey, bye") == ["hey", "bye"]
+    assert matcher.topic_ids("hi, how are you?") == ["how_are_you", "greeting"]
+
+
+def test_fusion_rewards_agreement_and_weights():
+    fused = reciprocal_rank_fusion(
+        {"lexical": [("mars", 5.0), ("venus", 4.0)], "vector": [("venus", 0.9), ("earth", 0.8)]}
+    )
+    assert fused[0][0] == "venus"
+    fused = reciprocal_rank_fusion(
+        {"pattern": [("greeting", 1.0)], "lexical": [("mars", 1.0)]}, {"pattern": 0.25}
+    )
+    assert [tid for tid, _score in fused] == ["mars", "greeting"]
+    assert reciprocal_rank_fusion({"lexical": [], "vector": None}) == []
+
+
+def test_pipeline_fuses_inline_and_background_retrievers():
+    pipeline = RetrievalPipeline(budget=1.0)
+    pipeline.add("lexical", lambda query, k: [("mars", 2.0), ("venus", 1.5)])
+    pipeline.add("vector", lambda query, k: [("mars", 0.9)], background=True)
+    assert pipeline.run("red planet", k=2)[0][0] == "mars"
+    stats = pipeline.stats()
+    assert stats["lexical"]["calls"] == stats["vector"]["calls"] == 1
+    assert stats["vector"]["timeouts"] == 0
+
+
+def test_pipeline_leaves_a_slow_retriever_behind():
+    release = threading.Event()
+
+    def slow(query, k):
+        release.wait(5)
+        return [("venus", 1.0)]
+
+    pipeline = RetrievalPipeline(budget=0.05)
+    pipeline.add("lexical", lambda query, k: [("mars", 1.0)])
+    pipeline.add("vector", slow, background=True)
+    start = time.monotonic()
+    assert pipeline.run("red planet", k=3) == [("mars", pytest.approx(1 / 61))]
+    assert time.monotonic() - start < 1
+    assert pipeline.stats()["vector"]["timeouts"] == 1
+    release.set()
+
+
+def test_pipeline_counts_errors_and_skips_busy_retrievers():
+    release = threading.Event()
+
+    def failing(query, k):
+        raise RuntimeError("index gone")
+
+    pipeline = RetrievalPipeline(budget=0.01, max_pending=1)
+    pipeline.add("lexical", failing)
+    pipeline.add("vector", lambda query, k: release.wait(5) and [], background=True)
+    assert pipeline.run("first") == []
+    # The first vector call is still outstanding, so the second is skipped
+    assert pipeline.run("second") == []
+    release.set()
+    stats = pipeline.stats()
+    assert stats["lexical"]["errors"] == 2
+    assert stats["vector"]["skipped"] == 1
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from scheduler import AdmissionScheduler, QueueFullError, QueueTimeoutError
+
+
+def test_timed_out_waiters_leave_the_queue():
+    async def main():
+        scheduler = AdmissionScheduler(max_concurrency=1, max_queue=2, timeout=0.1)
+        await scheduler.acquire()
+        for _ in range(2):
+            with pytest.raises(QueueTimeoutError):
+                await scheduler.acquire()
+        assert scheduler.depth == 0
+
+        # The queue is empty, so the next request waits instead of a 429
+        waiter = asyncio.ensure_future(scheduler.acquire())
+        await asyncio.sleep(0)
+        assert scheduler.depth == 1
+        scheduler.release()
+        await waiter
+        assert scheduler.stats()["in_flight"] == 1
+        assert scheduler.rejected == 0
+
+    asyncio.run(main())
+
+
+def test_cancelled_waiters_leave_the_queue():
+    async def main():
+        scheduler = AdmissionScheduler(max_concurrency=1, max_queue=1, timeout=10)
+        await scheduler.acquire()
+        waiter = asyncio.ensure_future(scheduler.acquire())
+        await asyncio.sleep(0)
+        assert scheduler.depth == 1
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert scheduler.depth == 0
+
+        scheduler.release()
+        assert scheduler.in_flight == 0
+
+    asyncio.run(main())
+
+
+def test_full_queue_rejects():
+    async def main():
+        scheduler = AdmissionScheduler(max_concurrency=1, max_queue=1, timeout=10)
+        await scheduler.acquire()
+        waiter = asyncio.ensure_future(scheduler.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFullError):
+            await scheduler.acquire()
+        scheduler.release()
+        await waiter
+        scheduler.release()
+        assert scheduler.in_flight == 0
+
+    asyncio.run(main())
@@ -0,0 +1,31 @@
+from retrieval import estimate_tokens
+from sessions import SessionStore
+
+
+def test_a_huge_turn_is_clipped_to_the_history_budget():
+    store = SessionStore(history_tokens=64, summary_tokens=32)
+    store.append("s", "why " * 500, "because " * 500)
+    session = store._sessions["s"]
+    (user, assistant, tokens), = session.turns
+    assert tokens == estimate_tokens(user) + estimate_tokens(assistant)
+    assert tokens <= 64
+    assert session.turn_tokens <= 64
+
+
+def test_history_stays_within_budget_across_turns():
+    store = SessionStore(history_tokens=64, summary_tokens=128)
+    for i in range(20):
+        store.append("s", f"question {i} " * 10, f"answer {i} " * 30)
+        session = store._sessions["s"]
+        assert session.turn_tokens <= 64
+        assert session.summary_tokens <= 128
+    history = store.history("s")
+    assert history[0].startswith("Summary of earlier conversation:\n- User asked: question")
+    assert history[-1].startswith("User: question 19")
+
+
+def test_short_turns_are_kept_verbatim():
+    store = SessionStore(history_tokens=64)
+    store.append("s", "What is Python?", "A programming language.")
+    assert store.history("s") == ["User: What is Python?\nAssistant: A programming language."]
+    assert store.history("new") == []